@@ -0,0 +1,120 @@
+"""
+Compare the direct-XML .pptx text extraction with the python-pptx object model extraction it replaces.
+
+Usage: python benchmarks/bench_pptx_extraction.py [--slides 50 200 500] [--repeat 3]
+
+The script checks that both extractors produce the same text on the example deck and on synthetic decks
+with text boxes, line breaks, tables, groups, pictures and notes, then reports the time and peak Python
+memory of each one.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils import extract_text_from_pptx  # noqa: E402
+
+
+EXAMPLE_DECK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example", "presentation_input.pptx")
+
+
+def extract_text_with_object_model(file_path):
+    """
+    The previous extract_text_from_pptx, building the full python-pptx object model.
+    """
+    text = ""
+    presentation = Presentation(file_path)
+    for slide in presentation.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                text += shape.text + "\n"
+        if slide.has_notes_slide:
+            notes_slide = slide.notes_slide
+            for shape in notes_slide.shapes:
+                if hasattr(shape, "text") and shape.text.strip():
+                    text += f"\nNote: {shape.text}"
+    return text
+
+
+def extract_text_with_xml(file_path):
+    return extract_text_from_pptx(file_path, None, 0)[0]
+
+
+def create_synthetic_deck(file_path, slides):
+    """
+    Create a deck with a mix of the shapes found in real course material, and a different picture on every slide.
+    """
+    noise = Image.effect_noise((400, 400), 60).convert("RGB")
+
+    presentation = Presentation()
+    for i in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {i + 1}: synthetic content"
+        body = slide.placeholders[1].text_frame
+        body.text = f"First point of slide {i + 1}"
+        for j in range(4):
+            paragraph = body.add_paragraph()
+            paragraph.text = f"Point {j} with a\vline break & <markup> characters"
+        textbox = slide.shapes.add_textbox(Inches(1), Inches(5), Inches(4), Inches(1))
+        textbox.text_frame.text = "Text box"
+        table = slide.shapes.add_table(2, 2, Inches(5), Inches(5), Inches(3), Inches(1)).table
+        table.cell(0, 0).text = "Table cell"
+        group = slide.shapes.add_group_shape()
+        group.shapes.add_textbox(Inches(0), Inches(0), Inches(1), Inches(1)).text_frame.text = "Grouped text"
+        picture = io.BytesIO()
+        noise.putpixel((0, 0), (i % 256, i // 256 % 256, 0))
+        noise.save(picture, format="PNG")
+        slide.shapes.add_picture(picture, Inches(6), Inches(1), Inches(2))
+        if i % 2 == 0:
+            slide.notes_slide.notes_text_frame.text = f"Speaker notes for slide {i + 1}\nSecond line"
+    presentation.save(file_path)
+
+
+def measure(extract, file_path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(file_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    extract(file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--slides", type=int, nargs="+", default=[50, 200, 500], help="Sizes of the synthetic decks.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measure, the best time is reported.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        decks = [("example", EXAMPLE_DECK)]
+        for slides in args.slides:
+            deck_path = os.path.join(temp_dir, f"synthetic_{slides}.pptx")
+            create_synthetic_deck(deck_path, slides)
+            decks.append((f"synthetic, {slides} slides", deck_path))
+
+        print(f"{'deck':<26}{'object model':>16}{'direct XML':>16}{'speedup':>10}{'peak memory (MB)':>22}")
+        for name, deck_path in decks:
+            if extract_text_with_object_model(deck_path) != extract_text_with_xml(deck_path):
+                raise SystemExit(f"Different output on {name}")
+            model_time, model_peak = measure(extract_text_with_object_model, deck_path, args.repeat)
+            xml_time, xml_peak = measure(extract_text_with_xml, deck_path, args.repeat)
+            print(f"{name:<26}{model_time * 1000:>14.1f}ms{xml_time * 1000:>14.1f}ms{model_time / xml_time:>9.1f}x"
+                  f"{model_peak / 1e6:>12.1f} -> {xml_peak / 1e6:.1f}")
+
+
+if __name__ == '__main__':
+    main()
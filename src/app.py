@@ -1,13 +1,15 @@
 import sys
+import threading
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QPushButton, QFileDialog, QComboBox, QLabel, QProgressBar,
                              QListWidget, QHBoxLayout, QCheckBox, QMessageBox, QProgressDialog)
 import os
 from dotenv import load_dotenv
-from languages import TRANSLATIONS
-from utils import (send_request_to_api, save_as_docx_file, extract_text_and_images_from_pptx, extract_text_from_pdf, extract_text_from_pptx,
-                    save_as_pdf_file, create_summary_prompt, extract_text_and_images_from_pdf)
+from languages import OUTPUT_LANGUAGES, TRANSLATIONS
+from backends import CancelledError
+from utils import save_summary_sets, count_pages, summarize_file, is_ocr_available
+from planner import plan_batch, format_plan
 
 
 class DocumentSummaryApp(QMainWindow):
@@ -16,10 +18,12 @@ class DocumentSummaryApp(QMainWindow):
 
     Attributes:
     - input_files (list): List of selected input files.
-    - output_language (str): Language for the output summary.
+    - output_languages (list): Languages for the output summaries, one output set per language.
     - current_language (str): Current language of the UI.
     - save_as_docx (bool): Flag to save the summary as a DOCX file.
     - save_as_pdf (bool): Flag to save the summary as a PDF file.
+    - extract_images (bool): Flag to include image descriptions in the summary.
+    - use_ocr (bool): Flag to read mostly-text images with local OCR instead of the vision API.
     """
 
     def __init__(self):
@@ -28,11 +32,13 @@ class DocumentSummaryApp(QMainWindow):
         """
         super().__init__()
         self.input_files = []
-        self.output_language = "Italian"  # Default output language
+        self.output_languages = ["Italian"]  # Default output language
         self.current_language = "Italiano"  # Track current UI language
         self.save_as_docx = True
         self.save_as_pdf = False
         self.extract_images = False
+        self.use_ocr = False
+        self.ocr_available = is_ocr_available()
         self.init_ui()
 
     def init_ui(self):
@@ -54,12 +60,17 @@ class DocumentSummaryApp(QMainWindow):
         self.ui_language_combo.setCurrentText("Italiano")
         self.ui_language_combo.currentTextChanged.connect(self.change_ui_language)
 
-        # Output language selection
+        # Output language selection (several languages can be selected at once)
         self.output_language_label = QLabel("Output Summary Language:")
-        self.output_language_combo = QComboBox()
-        self.output_language_combo.addItems(["English", "French", "Spanish", "Italian"])
-        self.output_language_combo.setCurrentText("Italian")
-        self.output_language_combo.currentTextChanged.connect(self.set_output_language)
+        output_language_layout = QHBoxLayout()
+        self.output_language_checkboxes = {}
+        for language in OUTPUT_LANGUAGES:
+            checkbox = QCheckBox(language)
+            checkbox.setChecked(language in self.output_languages)
+            checkbox.stateChanged.connect(lambda state, language=language: self.set_output_language(language, state))
+            output_language_layout.addWidget(checkbox)
+            self.output_language_checkboxes[language] = checkbox
+        output_language_layout.addStretch()
 
         # Output format options
         self.output_format_label = QLabel("Output Format:")
@@ -83,7 +94,14 @@ class DocumentSummaryApp(QMainWindow):
         self.image_checkbox = QCheckBox("Include Images")
         self.image_checkbox.setChecked(False)
         self.image_checkbox.stateChanged.connect(self.toggle_image_extraction)  # type: ignore
+        self.ocr_checkbox = QCheckBox("Local OCR for Text Images")
+        self.ocr_checkbox.setChecked(False)
+        self.ocr_checkbox.setEnabled(False)
+        if not self.ocr_available:
+            self.ocr_checkbox.setToolTip("Local OCR needs pytesseract and the Tesseract engine")
+        self.ocr_checkbox.stateChanged.connect(self.toggle_ocr)  # type: ignore
         image_layout.addWidget(self.image_checkbox)
+        image_layout.addWidget(self.ocr_checkbox)
         image_layout.addStretch()
 
         # Files list section
@@ -112,6 +130,10 @@ class DocumentSummaryApp(QMainWindow):
         self.process_btn.clicked.connect(self.process_files)
         self.process_btn.setEnabled(False)
 
+        self.dry_run_btn = QPushButton('Estimate Cost')
+        self.dry_run_btn.clicked.connect(self.dry_run)
+        self.dry_run_btn.setEnabled(False)
+
         # Progress bar and status
         self.status_label = QLabel('')
 
@@ -119,7 +141,7 @@ class DocumentSummaryApp(QMainWindow):
         layout.addWidget(self.ui_language_label)
         layout.addWidget(self.ui_language_combo)
         layout.addWidget(self.output_language_label)
-        layout.addWidget(self.output_language_combo)
+        layout.addLayout(output_language_layout)
         layout.addWidget(self.output_format_label)
         layout.addLayout(format_layout)
         layout.addWidget(self.image_extraction_label)  # Moved here
@@ -128,6 +150,7 @@ class DocumentSummaryApp(QMainWindow):
         layout.addWidget(self.files_label)
         layout.addWidget(self.files_list)
         layout.addLayout(file_buttons_layout)
+        layout.addWidget(self.dry_run_btn)
         layout.addWidget(self.process_btn)
         layout.addWidget(self.status_label)
 
@@ -196,6 +219,7 @@ class DocumentSummaryApp(QMainWindow):
             self.input_files.pop(current_row)
             if len(self.input_files) == 0:
                 self.process_btn.setEnabled(False)
+                self.dry_run_btn.setEnabled(False)
 
     def toggle_image_extraction(self, state):
         """
@@ -205,6 +229,17 @@ class DocumentSummaryApp(QMainWindow):
         - state (int): The state of the checkbox (0 or 2).
         """
         self.extract_images = state > 0
+        # Local OCR stays disabled when pytesseract or Tesseract is missing
+        self.ocr_checkbox.setEnabled(self.extract_images and self.ocr_available)
+
+    def toggle_ocr(self, state):
+        """
+        Toggle the local OCR pre-pass for images that are mostly text.
+
+        Parameters:
+        - state (int): The state of the checkbox (0 or 2).
+        """
+        self.use_ocr = state > 0
 
     def change_ui_language(self, language):
         """
@@ -220,6 +255,7 @@ class DocumentSummaryApp(QMainWindow):
         self.setWindowTitle(selected_lang["window_title"])
         self.select_files_btn.setText(selected_lang["select_files"])
         self.process_btn.setText(selected_lang["generate"])
+        self.dry_run_btn.setText(selected_lang["dry_run"])
         self.ui_language_label.setText(selected_lang["interface_lang"])
         self.output_language_label.setText(selected_lang["output_lang"])
         self.output_format_label.setText(selected_lang.get("output_format"))
@@ -231,15 +267,26 @@ class DocumentSummaryApp(QMainWindow):
         self.pdf_checkbox.setText("PDF")
         self.image_extraction_label.setText(selected_lang.get("content_options"))
         self.image_checkbox.setText(selected_lang.get("include_images"))
+        self.ocr_checkbox.setText(selected_lang.get("local_ocr"))
+        if not self.ocr_available:
+            self.ocr_checkbox.setToolTip(selected_lang.get("ocr_unavailable"))
 
-    def set_output_language(self, language):
+    def set_output_language(self, language, state):
         """
-        Set the output language for the summary.
+        Add or remove an output language for the summary.
 
         Parameters:
-        - language (str): The selected output language.
+        - language (str): The output language whose checkbox changed.
+        - state (int): The state of the checkbox (0 or 2).
         """
-        self.output_language = language
+        if state > 0:
+            if language not in self.output_languages:
+                self.output_languages.append(language)
+        elif language in self.output_languages:
+            self.output_languages.remove(language)
+        # Ensure at least one output language is selected
+        if not self.output_languages:
+            self.output_language_checkboxes[language].setChecked(True)
 
     def select_files(self):
         """
@@ -258,16 +305,34 @@ class DocumentSummaryApp(QMainWindow):
             for file_path in files:
                 self.files_list.addItem(os.path.basename(file_path))
             self.process_btn.setEnabled(True)
+            self.dry_run_btn.setEnabled(True)
 
             # Update status with current language
             selected_lang = TRANSLATIONS.get(self.current_language, TRANSLATIONS["Italiano"])
             self.status_label.setText(f"{selected_lang['selected_files']} {len(self.input_files)}")
 
+    def dry_run(self):
+        """
+        Estimate the API calls, upload size, prompt tokens and time of processing the selected files, without calling the API.
+        """
+        if not self.input_files:
+            return
+
+        output_languages = [language for language in self.output_language_checkboxes if language in self.output_languages]
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            plan = plan_batch(self.input_files, output_languages, self.extract_images, self.use_ocr)
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        selected_lang = TRANSLATIONS.get(self.current_language, TRANSLATIONS["Italiano"])
+        QMessageBox.information(self, selected_lang["dry_run"], format_plan(plan))
+
     def process_files(self):
         """
         Process the selected files, generate summaries, and save them in the selected format.
         """
-        global docx_path, pdf_path, file_filter
+        global file_filter
         if not self.input_files:
             return
 
@@ -275,75 +340,77 @@ class DocumentSummaryApp(QMainWindow):
         file_page_counts = {}
 
         for file_path in self.input_files:
-            file_extension = os.path.splitext(file_path)[1].lower()
             try:
-                if file_extension == '.pdf':
-                    import PyPDF2
-                    with open(file_path, 'rb') as file:
-                        pdf_reader = PyPDF2.PdfReader(file)
-                        page_count = len(pdf_reader.pages)
-                elif file_extension == '.pptx':
-                    from pptx import Presentation
-                    ppt = Presentation(file_path)
-                    page_count = len(ppt.slides)
-                else:
-                    page_count = 0
-
+                page_count = count_pages(file_path)
                 file_page_counts[file_path] = page_count
                 total_pages += page_count
             except Exception as e:
                 print(f"Error counting pages in {file_path}: {e}")
                 file_page_counts[file_path] = 0
 
-        progress = QProgressDialog("Processing Files...", None, 0, total_pages+len(self.input_files), self)
+        selected_lang = TRANSLATIONS.get(self.current_language, TRANSLATIONS["Italiano"])
+
+        # Cancel stops the extraction and the pending requests; the sections completed so far are kept
+        cancel_event = threading.Event()
+        progress = QProgressDialog("Processing Files...", selected_lang.get("cancel", "Cancel"), 0, total_pages+len(self.input_files), self)
         progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setAutoReset(False)
+        progress.canceled.connect(cancel_event.set)
         progress.show()
 
-        summaries = []
+        output_languages = [language for language in self.output_language_checkboxes if language in self.output_languages]
+        summaries = {language: [] for language in output_languages}
         current_page_progress = 0
+        cancelled = False
 
         for i, file_path in enumerate(self.input_files):
 
-            # Extract text based on file type
-            file_extension = os.path.splitext(file_path)[1].lower()
-
-            # Inside the process_files method, replace the file type checking block with:
             try:
-                if file_extension == '.pdf':
-                    if self.extract_images:
-                        text, current_page_progress = extract_text_and_images_from_pdf(file_path, progress, current_page_progress)
-                    else:
-                        text, current_page_progress = extract_text_from_pdf(file_path, progress, current_page_progress)
-                elif file_extension == '.pptx':
-                    if self.extract_images:
-                        text, current_page_progress = extract_text_and_images_from_pptx(file_path, progress, current_page_progress)
-                    else:
-                        text, current_page_progress = extract_text_from_pptx(file_path, progress, current_page_progress)
-                else:
+                # Extract the file once and get the summary in every output language from the same extracted text
+                section_contents, current_page_progress = summarize_file(
+                    file_path, output_languages, self.extract_images, self.use_ocr, progress, current_page_progress,
+                    cancel_event)
+                if section_contents is None:
                     continue
 
-                # Create prompt and get summary
-                prompt = create_summary_prompt(text, self.output_language)
-                section_content = send_request_to_api(prompt)
-
                 # Update progress bar
                 current_page_progress += 1
                 progress.setValue(current_page_progress)
                 QApplication.processEvents()  # Ensure UI updates
 
-                summaries.append({
-                    'title' : f"{i + 1}. {os.path.splitext(os.path.basename(file_path))[0]}",
-                    'content': section_content
-                })
+                for language in output_languages:
+                    summaries[language].append({
+                        'title' : f"{i + 1}. {os.path.splitext(os.path.basename(file_path))[0]}",
+                        'content': section_contents[language]
+                    })
+
+            except CancelledError:
+                cancelled = True
+                break
 
             except Exception as e:
                 error_msg = f"Error processing {os.path.basename(file_path)}: {str(e)}"
-                summaries.append({
-                    'title': f"{i + 1}. {os.path.splitext(os.path.basename(file_path))[0]}",
-                    'content': error_msg
-                })
-
-        selected_lang = TRANSLATIONS.get(self.current_language, TRANSLATIONS["Italiano"])
+                for language in output_languages:
+                    summaries[language].append({
+                        'title': f"{i + 1}. {os.path.splitext(os.path.basename(file_path))[0]}",
+                        'content': error_msg
+                    })
+
+        progress.close()
+
+        if cancelled:
+            completed = len(summaries[output_languages[0]]) if output_languages else 0
+            if not completed:
+                self.status_label.setText(selected_lang.get("cancelled", "Processing cancelled."))
+                return
+            answer = QMessageBox.question(
+                self,
+                selected_lang.get("cancel", "Cancel"),
+                selected_lang.get("export_partial", "Processing cancelled. Export the {} completed sections?").format(completed)
+            )
+            if answer != QMessageBox.StandardButton.Yes:
+                self.status_label.setText(selected_lang.get("cancelled", "Processing cancelled."))
+                return
 
         if self.save_as_docx and self.save_as_pdf:
             file_filter = "Word o PDF Files (*.docx *.pdf)"
@@ -360,30 +427,10 @@ class DocumentSummaryApp(QMainWindow):
         )
 
         if output_file:
-            base_path, ext = os.path.splitext(output_file)
-
-            if not ext:
-                if self.save_as_docx:
-                    docx_path = f"{base_path}.docx"
-                if self.save_as_pdf:
-                    pdf_path = f"{base_path}.pdf"
-            else:
-                if ext.lower() == '.docx':
-                    docx_path = output_file
-                    pdf_path = f"{base_path}.pdf"
-                elif ext.lower() == '.pdf':
-                    pdf_path = output_file
-                    docx_path = f"{base_path}.docx"
-                else:
-                    docx_path = f"{base_path}.docx"
-                    pdf_path = f"{base_path}.pdf"
-
             try:
-                if self.save_as_docx:
-                    save_as_docx_file(docx_path, summaries)
-
-                if self.save_as_pdf:
-                    save_as_pdf_file(pdf_path, summaries)
+                # The extension chosen in the dialog is replaced by the selected formats
+                formats = [output_format for output_format, selected in (("docx", self.save_as_docx), ("pdf", self.save_as_pdf)) if selected]
+                save_summary_sets(os.path.splitext(output_file)[0], summaries, formats)
 
                 self.status_label.setText(selected_lang.get("success_message", "Summary created successfully!"))
 
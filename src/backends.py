@@ -0,0 +1,796 @@
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+import requests
+
+
+IMAGE_DESCRIPTION = "image_description"
+CHUNK_EXPANSION = "chunk_expansion"
+NARRATIVE = "narrative"
+
+# Tasks without their own configuration use the configuration of the task they fall back to
+TASK_FALLBACKS = {
+    IMAGE_DESCRIPTION: None,
+    CHUNK_EXPANSION: NARRATIVE,
+    NARRATIVE: None,
+}
+
+
+class TransientRequestError(Exception):
+    """
+    A request failed because of a timeout, a connection error or a 5xx response, and may succeed later.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    A request was refused without being sent because the endpoint of its route is failing.
+    """
+
+
+class CancelledError(Exception):
+    """
+    A request was cancelled before its response arrived.
+    """
+
+
+def raise_if_cancelled(cancel_event):
+    """
+    Raise a CancelledError if the cancel event is set.
+
+    Parameters:
+    - cancel_event (threading.Event): The cancel event, or None.
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise CancelledError("Error: Cancelled.")
+
+def wait_or_cancel(seconds, cancel_event):
+    """
+    Sleep for a number of seconds, waking up early if the cancel event is set.
+
+    Parameters:
+    - seconds (float): The number of seconds to sleep.
+    - cancel_event (threading.Event): The cancel event, or None.
+
+    Raises:
+    - CancelledError: If the cancel event is set.
+    """
+    if cancel_event is None:
+        time.sleep(seconds)
+        return
+    cancel_event.wait(seconds)
+    raise_if_cancelled(cancel_event)
+
+
+# Rough number of characters per token, used to estimate prompt sizes without a tokenizer
+CHARACTERS_PER_TOKEN = 4
+
+
+class ContextCache:
+    """
+    Names of the cached contents created for the system instructions sent by a backend, so that each instruction
+    is uploaded once and then referenced by name until it expires.
+
+    The API only caches contents above a minimum size that depends on the model, so instructions estimated below
+    min_tokens are always sent inline without trying. A creation that fails anyway is remembered for the TTL too,
+    and the requests send the instruction inline meanwhile.
+
+    Attributes:
+    - ttl (int): Lifetime of a cached content, in seconds.
+    - min_tokens (int): Estimated size below which an instruction is not cached.
+    """
+
+    def __init__(self, ttl, min_tokens=0):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.entries = {}
+        self.creation_locks = {}
+        self.lock = threading.Lock()
+
+    def accepts(self, system_instruction):
+        """
+        Return whether a system instruction is large enough to be cached.
+
+        Parameters:
+        - system_instruction (str): The system instruction.
+
+        Returns:
+        - bool: True if the estimated size of the instruction reaches min_tokens.
+        """
+        return len(system_instruction) // CHARACTERS_PER_TOKEN >= self.min_tokens
+
+    def get(self, system_instruction, create):
+        """
+        Return the name of the cached content holding a system instruction, creating it on first use.
+
+        Parameters:
+        - system_instruction (str): The system instruction.
+        - create (callable): Function creating the cached content of an instruction for a TTL and returning its name.
+
+        Returns:
+        - str: The name of the cached content, or None if the instruction must be sent inline.
+        """
+        if not self.accepts(system_instruction):
+            return None
+        key = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+        with self.lock:
+            creation_lock = self.creation_locks.setdefault(key, threading.Lock())
+        # Only the requests with the same instruction wait for its creation, so that it is uploaded once
+        with creation_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            try:
+                name = create(system_instruction, self.ttl)
+            except Exception as e:
+                print(f"Error creating cached content, sending the system instruction inline: {e}")
+                name = None
+            with self.lock:
+                # Forget the entry a little before the cached content expires, so that no request references an expired one
+                self.entries[key] = (name, time.monotonic() + self.ttl * 0.9)
+            return name
+
+    def disable(self, name):
+        """
+        Stop using a cached content that the API refused, sending its instruction inline until the entry expires.
+
+        Parameters:
+        - name (str): The name of the cached content.
+        """
+        with self.lock:
+            for key, (entry_name, expires_at) in self.entries.items():
+                if entry_name == name:
+                    self.entries[key] = (None, expires_at)
+
+def create_context_cache():
+    """
+    Create the context cache of a backend if USE_CONTEXT_CACHE is enabled.
+
+    Returns:
+    - ContextCache: The context cache, with the CONTEXT_CACHE_TTL lifetime (default one hour) and the
+      CONTEXT_CACHE_MIN_TOKENS minimum size (default 4096), or None.
+    """
+    if os.getenv("USE_CONTEXT_CACHE", "").lower() not in ("1", "true", "yes"):
+        return None
+    return ContextCache(int(os.getenv("CONTEXT_CACHE_TTL") or "3600"), int(os.getenv("CONTEXT_CACHE_MIN_TOKENS") or "4096"))
+
+
+class GeminiBackend:
+    """
+    Backend sending requests to the Gemini generateContent REST endpoint.
+
+    Attributes:
+    - model_url (str): The generateContent URL of the model.
+    - api_key (str): The Google API key.
+    - timeout (float): Maximum number of seconds to wait for the response of a single HTTP call.
+    - transient_retries (int): Number of retries, with exponential backoff, after a transient error.
+    - session (requests.Session): The session whose connections are reused by all the calls of the backend.
+    - context_cache (ContextCache): The cached contents of the system instructions, or None if context caching is disabled.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_url, api_key, timeout=120):
+        self.model_url = model_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.transient_retries = int(os.getenv("TRANSIENT_RETRIES", "4"))
+        self.session = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=32))
+        self.context_cache = create_context_cache()
+
+    def create_cached_content(self, system_instruction, ttl):
+        """
+        Upload a system instruction to the cachedContents endpoint of the model's API.
+
+        Parameters:
+        - system_instruction (str): The system instruction.
+        - ttl (int): Lifetime of the cached content, in seconds.
+
+        Returns:
+        - str: The name of the cached content (e.g. "cachedContents/abc123").
+        """
+        base_url, _, model = self.model_url.partition("/models/")
+        if not model:
+            raise Exception(f"Error: Cannot derive the model name from {self.model_url}.")
+        data = {
+            "model": f"models/{model.split(':')[0]}",
+            "system_instruction": {
+                "parts": [{"text": system_instruction}]
+            },
+            "ttl": f"{ttl}s"
+        }
+        response = self.session.post(f"{base_url}/cachedContents?key={self.api_key}", headers={"Content-Type": "application/json"},
+                                     data=json.dumps(data), timeout=(min(10, self.timeout), self.timeout))
+        if response.status_code != 200:
+            raise Exception(f"Error {response.status_code}: {response.text}")
+        return response.json()["name"]
+
+    def generate(self, parts, max_retries=100, cancel_event=None, system_instruction=None):
+        """
+        Send the request parts to the model, retrying if the request fails due to a 429 error and retrying
+        with exponential backoff after timeouts, connection errors and 5xx responses.
+
+        With context caching, the system instruction is referenced through its cached content instead of being sent
+        again, and it is sent inline if the cached content cannot be created or used.
+
+        Parameters:
+        - parts (list): The parts of the request content (text and inline_data dictionaries).
+        - max_retries (int): Maximum number of retries for 429 responses.
+        - cancel_event (threading.Event): Event set to stop retrying, or None.
+        - system_instruction (str): The static instructions sent apart from the content, or None.
+
+        Returns:
+        - str: The response text.
+
+        Raises:
+        - TransientRequestError: If the request still fails with a transient error after all the retries.
+        - CancelledError: If cancel_event is set before a new attempt.
+        """
+        headers = {
+            "Content-Type": "application/json"
+        }
+
+        data = {
+            "generation_config": {
+                "temperature": 0,
+            },
+            "contents": [
+                {
+                    "parts": parts
+                }
+            ]
+        }
+        if system_instruction:
+            cached_content = self.context_cache.get(system_instruction, self.create_cached_content) if self.context_cache else None
+            if cached_content:
+                data["cachedContent"] = cached_content
+            else:
+                data["system_instruction"] = {"parts": [{"text": system_instruction}]}
+
+        retries = 0
+        transient_retries = 0
+        while retries <= max_retries:
+            raise_if_cancelled(cancel_event)
+            try:
+                response = self.session.post(f"{self.model_url}?key={self.api_key}", headers=headers, data=json.dumps(data),
+                                         timeout=(min(10, self.timeout), self.timeout))
+                if response.status_code == 200:
+                    result = response.json()
+                    try:
+                        return result['candidates'][0]['content']['parts'][0]['text'].replace("*", "")
+                    except (KeyError, IndexError):
+                        raise Exception("Error: Unexpected response structure.")
+                elif response.status_code == 429:
+                    retries += 1
+                    wait_or_cancel(1, cancel_event)
+                elif response.status_code >= 500:
+                    raise TransientRequestError(f"Error {response.status_code}: {response.text}")
+                elif "cachedContent" in data and response.status_code in (400, 403, 404):
+                    # The cached content expired or cannot be used with this model: send the instruction inline
+                    self.context_cache.disable(data.pop("cachedContent"))
+                    data["system_instruction"] = {"parts": [{"text": system_instruction}]}
+                else:
+                    raise Exception(f"Error {response.status_code}: {response.text}")
+            except (TransientRequestError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if transient_retries >= self.transient_retries:
+                    raise TransientRequestError(str(e))
+                # Exponential backoff with jitter: about 1, 2, 4, 8... seconds, capped at 30
+                wait_or_cancel(min(30, 2 ** transient_retries) * random.uniform(0.5, 1.0), cancel_event)
+                transient_retries += 1
+            except CancelledError:
+                raise
+            except Exception as e:
+                raise Exception(str(e))
+        raise Exception("Error: Maximum retries exceeded. Could not complete the request.")
+
+
+class StubBackend:
+    """
+    Local backend returning deterministic responses without any network call, for tests and offline runs.
+
+    The simulated latency of each call can be set with the STUB_LATENCY environment variable (in seconds). A call
+    whose latency exceeds the timeout fails with a TransientRequestError, as a hung connection would. Context caching
+    is emulated: with USE_CONTEXT_CACHE, each system instruction is uploaded once and then referenced by name.
+
+    Attributes:
+    - model_url (str): The model name, echoed in the responses.
+    - calls (list): The parts of every request received, in order.
+    - cached_contents (dict): The system instructions of the emulated cached contents, by name.
+    - uploaded_characters (int): The number of characters of text and system instructions received.
+    """
+
+    name = "stub"
+
+    def __init__(self, model_url=None, api_key=None, timeout=120):
+        self.model_url = model_url or "stub-model"
+        self.timeout = timeout
+        self.latency = float(os.getenv("STUB_LATENCY", "0"))
+        self.calls = []
+        self.cached_contents = {}
+        self.uploaded_characters = 0
+        self.lock = threading.Lock()
+        self.context_cache = create_context_cache()
+
+    def create_cached_content(self, system_instruction, ttl):
+        """
+        Emulate the upload of a system instruction to the cachedContents endpoint.
+        """
+        with self.lock:
+            name = f"cachedContents/stub-{len(self.cached_contents) + 1}"
+            self.cached_contents[name] = system_instruction
+            self.uploaded_characters += len(system_instruction)
+        return name
+
+    def generate(self, parts, max_retries=100, cancel_event=None, system_instruction=None):
+        """
+        Return a deterministic response describing the request parts.
+
+        Parameters:
+        - parts (list): The parts of the request content (text and inline_data dictionaries).
+        - max_retries (int): Ignored, the stub never answers with a 429 error.
+        - cancel_event (threading.Event): Event set to cancel the simulated call, or None.
+        - system_instruction (str): The static instructions sent apart from the content, or None.
+
+        Returns:
+        - str: The response text.
+        """
+        cached_content = None
+        if system_instruction and self.context_cache is not None:
+            cached_content = self.context_cache.get(system_instruction, self.create_cached_content)
+        text = " ".join(part["text"] for part in parts if "text" in part)
+        with self.lock:
+            self.calls.append(parts)
+            # As with the API, the instruction of a cached content is not uploaded again
+            self.uploaded_characters += len(text) + (len(system_instruction or "") if cached_content is None else 0)
+        if self.latency:
+            wait_or_cancel(min(self.latency, self.timeout), cancel_event)
+            if self.latency > self.timeout:
+                raise TransientRequestError(f"Error: Stub request timed out after {self.timeout} seconds.")
+
+        images = [part for part in parts if "inline_data" in part]
+        if images:
+            image_size = sum(len(part["inline_data"]["data"]) for part in images)
+            return f"Stub description from {self.model_url} of an image of {image_size} bytes."
+        if cached_content:
+            return f"Stub response from {self.model_url} to a prompt of {len(text)} characters with the instruction of {cached_content}."
+        if system_instruction:
+            return f"Stub response from {self.model_url} to a prompt of {len(text)} characters with an instruction of {len(system_instruction)} characters."
+        return f"Stub response from {self.model_url} to a prompt of {len(text)} characters."
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    StubBackend.name: StubBackend,
+}
+
+def register_backend(name, backend_class):
+    """
+    Register a backend so that it can be selected by name in the route configuration.
+
+    Parameters:
+    - name (str): The name used in the *_BACKEND environment variables.
+    - backend_class (type): A class built with (model_url, api_key, timeout) and exposing
+      generate(parts, max_retries, cancel_event, system_instruction).
+    """
+    BACKENDS[name] = backend_class
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most requests_per_minute calls start in any minute.
+
+    Attributes:
+    - interval (float): The minimum number of seconds between two calls (0 for no limit).
+    """
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0
+        self.next_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self, cancel_event=None):
+        """
+        Block until the next call is allowed to start.
+
+        Parameters:
+        - cancel_event (threading.Event): Event set to stop waiting, or None.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            call_time = max(now, self.next_call)
+            self.next_call = call_time + self.interval
+        if call_time > now:
+            wait_or_cancel(call_time - now, cancel_event)
+
+    def try_acquire(self):
+        """
+        Reserve a call start only if it is allowed right now, without waiting.
+
+        Returns:
+        - bool: True if the call may start now, False if it would have to wait.
+        """
+        if not self.interval:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if self.next_call > now:
+                return False
+            self.next_call = now + self.interval
+            return True
+
+
+class DaemonExecutor:
+    """
+    Runs functions on a fixed number of daemon threads, started on first use.
+
+    Unlike the threads of a ThreadPoolExecutor, which the interpreter joins at exit, a thread stuck in an HTTP call
+    that nobody awaits any more (after a cancellation or a hedge) does not keep the process alive.
+
+    Attributes:
+    - max_workers (int): Number of threads.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.tasks = queue.SimpleQueue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """
+        Queue a call of fn with the given arguments.
+
+        Returns:
+        - Future: The future of the result of the call.
+        """
+        future = Future()
+        self.tasks.put((future, fn, args))
+        with self.lock:
+            if len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self.work, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        return future
+
+    def work(self):
+        while True:
+            future, fn, args = self.tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while an endpoint is clearly down.
+
+    After failure_threshold consecutive transient failures the circuit opens and calls are refused for
+    reset_timeout seconds. Then a single trial call is let through: if it succeeds the circuit closes,
+    otherwise it opens again.
+
+    Attributes:
+    - failure_threshold (int): Number of consecutive failures that opens the circuit (0 disables the breaker).
+    - reset_timeout (float): Number of seconds the circuit stays open before a trial call.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check whether a call may be sent.
+
+        Raises:
+        - CircuitOpenError: If the circuit is open, or half-open with a trial call already in progress.
+        """
+        if not self.failure_threshold:
+            return
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_progress:
+                raise CircuitOpenError("Error: The endpoint is failing, request not sent (circuit open).")
+            self.trial_in_progress = True
+
+    def record_success(self):
+        """
+        Record a successful call, closing the circuit.
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_cancel(self):
+        """
+        Record a cancelled call, which says nothing about the endpoint: a trial call may be sent again.
+        """
+        with self.lock:
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        """
+        Record a transient failure, opening the circuit after too many consecutive failures.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_progress or (self.failure_threshold and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+            self.trial_in_progress = False
+
+
+class Route:
+    """
+    A task routed to a backend and model, with its own concurrency and rate limits.
+
+    When hedging is enabled, a call still running after the hedge_percentile latency of the previous calls is
+    duplicated, and the first response is kept.
+
+    Attributes:
+    - task (str): The task served by the route.
+    - backend: The backend instance answering the requests.
+    - concurrency (int): Maximum number of requests in flight at the same time.
+    - requests_per_minute (int): Maximum number of requests started per minute (0 for no limit).
+    - hedge_percentile (float): Latency percentile after which a duplicate request is sent (0 disables hedging).
+    - circuit_breaker (CircuitBreaker): The circuit breaker of the route's endpoint.
+    """
+
+    # Minimum number of latency samples before hedging starts
+    min_hedge_samples = 10
+
+    def __init__(self, task, backend, concurrency, requests_per_minute, hedge_percentile=0, circuit_breaker=None):
+        self.task = task
+        self.backend = backend
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.hedge_percentile = hedge_percentile
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(0, 0)
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.latencies = deque(maxlen=200)
+        self.executor = DaemonExecutor(2 * concurrency)
+
+    def hedge_delay(self):
+        """
+        Return the latency after which a call is hedged, or None if hedging is disabled or there are too few samples.
+
+        Returns:
+        - float: The hedge_percentile latency of the recent successful calls, in seconds.
+        """
+        if not self.hedge_percentile or len(self.latencies) < self.min_hedge_samples:
+            return None
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return latencies[index]
+
+    def timed_generate(self, parts, max_retries, cancel_event=None, system_instruction=None):
+        """
+        Call the backend and record the latency of successful calls.
+
+        Parameters:
+        - parts (list): The parts of the request content.
+        - max_retries (int): Maximum number of retries for the request.
+        - cancel_event (threading.Event): Event set to cancel the request, or None.
+        - system_instruction (str): The static instructions sent apart from the content, or None.
+
+        Returns:
+        - str: The response text.
+        """
+        start = time.monotonic()
+        result = self.backend.generate(parts, max_retries, cancel_event, system_instruction)
+        self.latencies.append(time.monotonic() - start)
+        return result
+
+    def submit_call(self, parts, max_retries, cancel_event, system_instruction):
+        """
+        Run a call on the executor. The caller holds a concurrency slot for it, released when the call finishes,
+        even if its result is no longer awaited.
+
+        Returns:
+        - Future: The future of the response text.
+        """
+        future = self.executor.submit(self.timed_generate, parts, max_retries, cancel_event, system_instruction)
+        future.add_done_callback(lambda _: self.semaphore.release())
+        return future
+
+    def run_call(self, parts, max_retries, cancel_event, system_instruction=None):
+        """
+        Call the backend, sending a duplicate request if hedging is enabled and no response arrives in time,
+        and giving up as soon as the call is cancelled.
+
+        The concurrency slot acquired by generate is released when the first call finishes. The duplicate
+        request is only sent if another slot and a rate limit slot are free, so the route never has more than
+        concurrency calls in flight, and hedging never waits. Once a response arrives or the call is cancelled, the other call is cancelled too: it makes
+        no further attempt, and an HTTP call already in flight ends on its own within the route's timeout. The calls run
+        on daemon threads, so such a call does not delay the exit of the process.
+
+        Parameters:
+        - parts (list): The parts of the request content.
+        - max_retries (int): Maximum number of retries for the request.
+        - cancel_event (threading.Event): Event set to cancel the request, or None.
+        - system_instruction (str): The static instructions sent apart from the content, or None.
+
+        Returns:
+        - str: The first successful response text.
+
+        Raises:
+        - CancelledError: If cancel_event is set before a response arrives.
+        """
+        delay = self.hedge_delay()
+        if delay is None and cancel_event is None:
+            try:
+                return self.timed_generate(parts, max_retries, None, system_instruction)
+            finally:
+                self.semaphore.release()
+
+        # Set when run_call returns, to stop the calls still running
+        calls_cancel_event = threading.Event()
+        futures = {self.submit_call(parts, max_retries, calls_cancel_event, system_instruction)}
+        hedge_at = time.monotonic() + delay if delay is not None else None
+        error = None
+        try:
+            while futures:
+                raise_if_cancelled(cancel_event)
+                timeout = 0.1 if cancel_event is not None else None
+                if hedge_at is not None:
+                    remaining = max(0, hedge_at - time.monotonic())
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                done, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+                if futures and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    # Still no response after the hedge delay: send a duplicate and keep the first response. The hedge is
+                    # skipped unless a concurrency slot and a rate limit slot are both free right now, so that it never
+                    # delays the primary call's response
+                    if self.semaphore.acquire(blocking=False):
+                        if self.rate_limiter.try_acquire():
+                            futures.add(self.submit_call(parts, max_retries, calls_cancel_event, system_instruction))
+                        else:
+                            self.semaphore.release()
+            raise error
+        finally:
+            calls_cancel_event.set()
+
+    def acquire_slot(self, cancel_event):
+        """
+        Wait for a free concurrency slot.
+
+        Parameters:
+        - cancel_event (threading.Event): Event set to stop waiting, or None.
+
+        Raises:
+        - CancelledError: If cancel_event is set while waiting.
+        """
+        if cancel_event is None:
+            self.semaphore.acquire()
+            return
+        while not self.semaphore.acquire(timeout=0.1):
+            raise_if_cancelled(cancel_event)
+
+    def generate(self, parts, max_retries=100, cancel_event=None, system_instruction=None):
+        """
+        Send a request through the route, waiting for a free concurrency slot and for the rate limit.
+
+        Parameters:
+        - parts (list): The parts of the request content.
+        - max_retries (int): Maximum number of retries for the request.
+        - cancel_event (threading.Event): Event set to cancel the request, or None.
+        - system_instruction (str): The static instructions sent apart from the content, or None.
+
+        Returns:
+        - str: The response text.
+
+        Raises:
+        - CircuitOpenError: If the route's endpoint is failing and the request was not sent.
+        - CancelledError: If cancel_event is set before a response arrives.
+        """
+        raise_if_cancelled(cancel_event)
+        self.circuit_breaker.before_call()
+        try:
+            self.acquire_slot(cancel_event)
+        except CancelledError:
+            self.circuit_breaker.record_cancel()
+            raise
+        try:
+            self.rate_limiter.wait(cancel_event)
+        except CancelledError:
+            self.semaphore.release()
+            self.circuit_breaker.record_cancel()
+            raise
+        try:
+            # run_call releases the slot
+            result = self.run_call(parts, max_retries, cancel_event, system_instruction)
+        except TransientRequestError:
+            self.circuit_breaker.record_failure()
+            raise
+        except CancelledError:
+            self.circuit_breaker.record_cancel()
+            raise
+        except Exception:
+            # Permanent errors say nothing about the health of the endpoint
+            self.circuit_breaker.record_success()
+            raise
+        self.circuit_breaker.record_success()
+        return result
+
+
+_routes = {}
+_routes_lock = threading.Lock()
+
+def get_task_setting(task, setting, default=None):
+    """
+    Read a route setting from the environment, falling back to the task's fallback task.
+
+    Settings are read from variables named after the task, for example IMAGE_DESCRIPTION_MODEL or
+    NARRATIVE_CONCURRENCY. Empty values are treated as unset.
+
+    Parameters:
+    - task (str): The task whose setting is read.
+    - setting (str): The name of the setting (MODEL, BACKEND, CONCURRENCY, RPM, TIMEOUT, HEDGE_PERCENTILE,
+      BREAKER_THRESHOLD or BREAKER_RESET).
+    - default (str): The value used when neither the task nor its fallbacks configure the setting.
+
+    Returns:
+    - str: The configured value.
+    """
+    while task is not None:
+        value = os.getenv(f"{task.upper()}_{setting}")
+        if value:
+            return value
+        task = TASK_FALLBACKS.get(task)
+    return default
+
+def get_route(task):
+    """
+    Return the route for a task, building it from the environment on first use.
+
+    Parameters:
+    - task (str): One of IMAGE_DESCRIPTION, CHUNK_EXPANSION or NARRATIVE.
+
+    Returns:
+    - Route: The route serving the task.
+    """
+    with _routes_lock:
+        if task not in _routes:
+            backend_name = get_task_setting(task, "BACKEND", os.getenv("MODEL_BACKEND") or GeminiBackend.name)
+            if backend_name not in BACKENDS:
+                raise Exception(f"Error: Unknown backend '{backend_name}' for task '{task}'.")
+            model_url = get_task_setting(task, "MODEL", os.getenv("GOOGLE_MODEL"))
+            timeout = float(get_task_setting(task, "TIMEOUT", "120"))
+            backend = BACKENDS[backend_name](model_url, os.getenv("API_KEY"), timeout)
+            concurrency = int(get_task_setting(task, "CONCURRENCY", "4"))
+            requests_per_minute = int(get_task_setting(task, "RPM", "0"))
+            hedge_percentile = float(get_task_setting(task, "HEDGE_PERCENTILE", "0"))
+            circuit_breaker = CircuitBreaker(int(get_task_setting(task, "BREAKER_THRESHOLD", "5")),
+                                             float(get_task_setting(task, "BREAKER_RESET", "30")))
+            _routes[task] = Route(task, backend, concurrency, requests_per_minute, hedge_percentile, circuit_breaker)
+        return _routes[task]
+
+def reset_routes():
+    """
+    Forget the routes built so far, so that they are rebuilt from the current environment.
+    """
+    with _routes_lock:
+        _routes.clear()
@@ -0,0 +1,99 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from planner import plan_batch, format_plan
+from languages import OUTPUT_LANGUAGES
+from utils import (OUTPUT_FORMATS, save_summary_sets, extract_document, save_document, load_document,
+                   render_document_text, generate_summaries)
+
+
+INTERMEDIATE_EXTENSION = ".extract.json"
+
+
+def extract(args):
+    """
+    Extract each input file into an intermediate file, without calling the text generation API.
+
+    Parameters:
+    - args (argparse.Namespace): The files, output directory and image options.
+    """
+    os.makedirs(args.output_dir, exist_ok=True)
+    for file_path in args.files:
+        document, _ = extract_document(file_path, args.images, args.ocr)
+        if document is None:
+            print(f"Skipping unsupported file {file_path}")
+            continue
+        output_path = os.path.join(args.output_dir, os.path.basename(file_path) + INTERMEDIATE_EXTENSION)
+        save_document(output_path, document)
+        print(output_path)
+
+def generate(args):
+    """
+    Generate the summaries of intermediate files in every output language and save them with the exporters.
+
+    Parameters:
+    - args (argparse.Namespace): The intermediate files, languages, formats and output path.
+    """
+    documents = [load_document(input_path) for input_path in args.intermediates]
+    summaries = {language: [] for language in args.languages}
+
+    for i, document in enumerate(documents):
+        title = f"{i + 1}. {os.path.splitext(document['source'])[0]}"
+        text = render_document_text(document)
+        if args.show_text:
+            print(f"--- {document['source']} ({document['content_hash'][:12]}) ---\n{text}")
+        section_contents = generate_summaries(text, args.languages)
+        for language in args.languages:
+            summaries[language].append({
+                'title': title,
+                'content': section_contents[language]
+            })
+
+    for output_path in save_summary_sets(os.path.splitext(args.output)[0], summaries, args.formats):
+        print(output_path)
+
+def plan(args):
+    """
+    Print the estimated calls, upload size, prompt tokens and time of processing the input files, without calling the API.
+
+    Parameters:
+    - args (argparse.Namespace): The files, languages and image options.
+    """
+    print(format_plan(plan_batch(args.files, args.languages, args.images, args.ocr)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract documents and generate their summaries in separate stages.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = subparsers.add_parser("extract", help="Extract PDF and PPTX files into intermediate files.")
+    extract_parser.add_argument("files", nargs="+", help="The PDF and PPTX files to extract.")
+    extract_parser.add_argument("--output-dir", default=".", help="Directory where the intermediate files are written.")
+    extract_parser.add_argument("--images", action="store_true", help="Include descriptions of the images.")
+    extract_parser.add_argument("--ocr", action="store_true", help="Read mostly-text images with local OCR.")
+    extract_parser.set_defaults(func=extract)
+
+    generate_parser = subparsers.add_parser("generate", help="Generate summaries from intermediate files.")
+    generate_parser.add_argument("intermediates", nargs="+", help=f"The {INTERMEDIATE_EXTENSION} files, in output order.")
+    generate_parser.add_argument("--languages", nargs="+", default=["Italian"], choices=OUTPUT_LANGUAGES, help="Output languages.")
+    generate_parser.add_argument("--formats", nargs="+", default=["docx"], choices=OUTPUT_FORMATS, help="Output formats.")
+    generate_parser.add_argument("--output", default="summary", help="Output path, without extension.")
+    generate_parser.add_argument("--show-text", action="store_true", help="Print the text sent for each document.")
+    generate_parser.set_defaults(func=generate)
+
+    plan_parser = subparsers.add_parser("plan", help="Estimate the cost and time of processing files, without calling the API.")
+    plan_parser.add_argument("files", nargs="+", help="The PDF and PPTX files to process.")
+    plan_parser.add_argument("--languages", nargs="+", default=["Italian"], choices=OUTPUT_LANGUAGES, help="Output languages.")
+    plan_parser.add_argument("--images", action="store_true", help="Include descriptions of the images.")
+    plan_parser.add_argument("--ocr", action="store_true", help="Read mostly-text images with local OCR.")
+    plan_parser.set_defaults(func=plan)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"))
+    main()
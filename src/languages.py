@@ -1,8 +1,12 @@
+# Languages in which the summaries can be generated (the names used in the summary prompts)
+OUTPUT_LANGUAGES = ["English", "French", "Spanish", "Italian"]
+
 TRANSLATIONS = {
     "English": {
         "window_title": "PDF and PPTX to Word Summary",
         "select_files": "Select PDF and PPTX Files",
         "generate": "Generate Summary",
+        "dry_run": "Estimate Cost",
         "interface_lang": "Interface Language:",
         "output_lang": "Output Summary Language:",
         "success_message": "Summary generated successfully!",
@@ -12,12 +16,18 @@ TRANSLATIONS = {
         "move_down": "Move Down",
         "remove": "Remove",
         "content_options": "Content Options:",
-        "include_images": "Include Images"
+        "include_images": "Include Images",
+        "local_ocr": "Local OCR for Text Images",
+        "ocr_unavailable": "Local OCR needs pytesseract and the Tesseract engine",
+        "cancel": "Cancel",
+        "cancelled": "Processing cancelled.",
+        "export_partial": "Processing cancelled. Export the {} completed sections?"
     },
     "Français": {
         "window_title": "Résumé PDF et PPTX vers Word",
         "select_files": "Sélectionner les fichiers PDF et PPTX",
         "generate": "Générer le résumé",
+        "dry_run": "Estimer le coût",
         "interface_lang": "Langue de l'interface:",
         "output_lang": "Langue du résumé:",
         "success_message": "Résumé généré avec succès!",
@@ -27,12 +37,18 @@ TRANSLATIONS = {
         "move_down": "Descendre",
         "remove": "Supprimer",
         "content_options": "Options de contenu:",
-        "include_images": "Inclure les images"
+        "include_images": "Inclure les images",
+        "local_ocr": "OCR local pour les images de texte",
+        "ocr_unavailable": "L'OCR local nécessite pytesseract et le moteur Tesseract",
+        "cancel": "Annuler",
+        "cancelled": "Traitement annulé.",
+        "export_partial": "Traitement annulé. Exporter les {} sections terminées ?"
     },
     "Italiano": {
         "window_title": "Riassunto PDF e PPTX in Word",
         "select_files": "Seleziona file PDF e PPTX",
         "generate": "Genera riassunto",
+        "dry_run": "Stima il costo",
         "interface_lang": "Lingua dell'interfaccia:",
         "output_lang": "Lingua del riassunto:",
         "success_message": "Riassunto generato con successo!",
@@ -42,12 +58,18 @@ TRANSLATIONS = {
         "move_down": "Sposta giù",
         "remove": "Rimuovi",
         "content_options": "Opzioni di contenuto:",
-        "include_images": "Includi immagini"
+        "include_images": "Includi immagini",
+        "local_ocr": "OCR locale per immagini di testo",
+        "ocr_unavailable": "L'OCR locale richiede pytesseract e il motore Tesseract",
+        "cancel": "Annulla",
+        "cancelled": "Elaborazione annullata.",
+        "export_partial": "Elaborazione annullata. Esportare le {} sezioni completate?"
     },
     "Español": {
         "window_title": "Resumen de PDF y PPTX a Word",
         "select_files": "Seleccionar archivos PDF y PPTX",
         "generate": "Generar resumen",
+        "dry_run": "Estimar el coste",
         "interface_lang": "Idioma de la interfaz:",
         "output_lang": "Idioma del resumen:",
         "success_message": "¡Resumen generado con éxito!",
@@ -57,6 +79,11 @@ TRANSLATIONS = {
         "move_down": "Bajar",
         "remove": "Eliminar",
         "content_options": "Opciones de contenido:",
-        "include_images": "Incluir imágenes"
+        "include_images": "Incluir imágenes",
+        "local_ocr": "OCR local para imágenes de texto",
+        "ocr_unavailable": "El OCR local requiere pytesseract y el motor Tesseract",
+        "cancel": "Cancelar",
+        "cancelled": "Procesamiento cancelado.",
+        "export_partial": "Procesamiento cancelado. ¿Exportar las {} secciones completadas?"
     }
 }
\ No newline at end of file
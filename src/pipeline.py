@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from backends import raise_if_cancelled
+
+
+class ImagePipeline:
+    """
+    Streams images from the page walkers to the workers that describe them, keeping at most max_inflight_bytes
+    of source image data queued or in process at once.
+
+    submit blocks the producer while the byte budget is used up, so a deck with many high resolution images
+    never holds more than the budget, whatever its size. An image larger than the whole budget is accepted
+    only when nothing else is in flight. The budget counts the encoded source bytes only: each busy worker
+    also holds what its process function derives from them (for the image descriptions, the PNG encoding and
+    the base64 request body while the request is in flight).
+
+    Identical images submitted with the same arguments are processed once: later submits get the future of the
+    first one, so an image repeated on every page (e.g. a logo) is sent to the API once even while its first
+    description is still pending.
+
+    Attributes:
+    - process (callable): The function called by the workers with the image bytes and the extra arguments.
+    - max_inflight_bytes (int): Maximum number of image bytes submitted and not yet processed.
+    - on_wait (callable): Function called regularly while the producer is blocked (e.g. to keep the UI responsive).
+    - cancel_event (threading.Event): Event set to cancel the pipeline: queued images are dropped and waiting stops.
+    """
+
+    def __init__(self, process, max_inflight_bytes, workers, on_wait=None, cancel_event=None):
+        self.process = process
+        self.max_inflight_bytes = max_inflight_bytes
+        self.on_wait = on_wait
+        self.cancel_event = cancel_event
+        self.inflight_bytes = 0
+        self.futures = {}
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        cancelled = self.cancel_event is not None and self.cancel_event.is_set()
+        self.executor.shutdown(wait=True, cancel_futures=cancelled)
+
+    def _run(self, image_bytes, *args):
+        size = len(image_bytes)
+        try:
+            raise_if_cancelled(self.cancel_event)
+            return self.process(image_bytes, *args)
+        finally:
+            # The bytes are no longer referenced once the worker returns
+            del image_bytes
+            with self.condition:
+                self.inflight_bytes -= size
+                self.condition.notify_all()
+
+    def submit(self, image_bytes, *args):
+        """
+        Queue an image for processing, blocking while the byte budget is used up. An image already submitted
+        with the same arguments is not queued again.
+
+        Parameters:
+        - image_bytes (bytes): The encoded image.
+        - args: Extra arguments passed to the process function.
+
+        Returns:
+        - Future: The future of the process function's result.
+
+        Raises:
+        - CancelledError: If the pipeline is cancelled.
+        """
+        key = (hashlib.sha256(image_bytes).hexdigest(), args)
+        if key in self.futures:
+            return self.futures[key]
+
+        size = len(image_bytes)
+        with self.condition:
+            while self.inflight_bytes and self.inflight_bytes + size > self.max_inflight_bytes:
+                raise_if_cancelled(self.cancel_event)
+                self.condition.wait(timeout=0.1)
+                if self.on_wait:
+                    self.on_wait()
+            self.inflight_bytes += size
+        future = self.executor.submit(self._run, image_bytes, *args)
+        self.futures[key] = future
+        return future
+
+    def result(self, future):
+        """
+        Wait for the result of a submitted image.
+
+        Parameters:
+        - future (Future): A future returned by submit.
+
+        Returns:
+        - The result of the process function (its exception is raised again if it failed).
+
+        Raises:
+        - CancelledError: If the pipeline is cancelled.
+        """
+        while True:
+            raise_if_cancelled(self.cancel_event)
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                if self.on_wait:
+                    self.on_wait()
@@ -0,0 +1,197 @@
+import hashlib
+import math
+import os
+
+import fitz  # PyMuPDF
+
+from backends import get_route, get_task_setting, CHARACTERS_PER_TOKEN, IMAGE_DESCRIPTION, NARRATIVE
+from pptx_reader import PptxReader
+from utils import (count_pages, extract_document, render_document_text, create_summary_request, load_cached_stage,
+                   is_ocr_available, ocr_cache_key, image_description_cache_key, FITZ_LOCK, IMAGE_DESCRIPTION_PROMPT)
+
+
+# Tokens billed for an image input, and tokens added to the prompt by an image description
+TOKENS_PER_IMAGE = 258
+TOKENS_PER_DESCRIPTION = 60
+# Default latencies (seconds) used when no call has been measured yet
+DEFAULT_LATENCIES = {
+    IMAGE_DESCRIPTION: 4,
+    NARRATIVE: 30,
+}
+
+
+def iter_image_bytes(file_path):
+    """
+    Iterate over the images the extractors would describe, without decoding them or calling any API.
+
+    Parameters:
+    - file_path (str): The path to the PDF or PPTX file.
+
+    Returns:
+    - generator: The encoded bytes of each image, in extraction order.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.pdf':
+        # FITZ_LOCK is released while the caller consumes each image
+        with FITZ_LOCK:
+            pdf_document = fitz.open(file_path)
+            xrefs = [img_info[0] for page in pdf_document for img_info in page.get_images(full=True)]
+        try:
+            for xref in xrefs:
+                with FITZ_LOCK:
+                    image_bytes = pdf_document.extract_image(xref)["image"]
+                yield image_bytes
+        finally:
+            with FITZ_LOCK:
+                pdf_document.close()
+    elif file_extension == '.pptx':
+        with PptxReader(file_path) as reader:
+            for slide in reader.slides():
+                for shape in slide["shapes"]:
+                    if shape["type"] == "picture":
+                        yield reader.read_part(shape["part"])
+
+def estimate_latency(task):
+    """
+    Return the expected latency of a call, from the calls measured in this session or from the configuration.
+
+    Parameters:
+    - task (str): The task of the call.
+
+    Returns:
+    - float: The median latency of the measured calls, or the {TASK}_LATENCY_ESTIMATE setting, in seconds.
+    """
+    latencies = sorted(get_route(task).latencies)
+    if latencies:
+        return latencies[len(latencies) // 2]
+    return float(get_task_setting(task, "LATENCY_ESTIMATE", str(DEFAULT_LATENCIES.get(task, 30))))
+
+def estimate_calls_time(task, calls):
+    """
+    Estimate the wall time of a group of calls sent together, at the concurrency and rate limit of their route.
+
+    Parameters:
+    - task (str): The task of the calls.
+    - calls (int): The number of calls.
+
+    Returns:
+    - float: The estimated time in seconds.
+    """
+    if not calls:
+        return 0
+    route = get_route(task)
+    time_by_concurrency = math.ceil(calls / route.concurrency) * estimate_latency(task)
+    time_by_rate = (calls - 1) * 60 / route.requests_per_minute if route.requests_per_minute else 0
+    return max(time_by_concurrency, time_by_rate)
+
+def plan_batch(file_paths, target_languages, include_images=False, use_ocr=False):
+    """
+    Estimate what processing a batch of files would cost, without calling the API.
+
+    Pages are counted as in process_files, the text is extracted locally, and the images are enumerated
+    and checked against the stage cache. With context caching, the system instruction of each language is
+    counted in the upload only once, if it is large enough for the cache to accept it.
+
+    Parameters:
+    - file_paths (list): The paths to the PDF and PPTX files.
+    - target_languages (list): The output languages.
+    - include_images (bool): Whether image descriptions would be included.
+    - use_ocr (bool): Whether mostly-text images would be read with local OCR.
+
+    Returns:
+    - dict: The number of files and pages, vision and text calls, images found in the cache, images that local OCR
+      may keep away from the API, upload bytes, estimated prompt tokens and estimated wall time in seconds.
+    """
+    plan = {
+        "files": 0,
+        "pages": 0,
+        "images": 0,
+        "vision_calls": 0,
+        "text_calls": 0,
+        "cache_hits": 0,
+        "ocr_candidates": 0,
+        "upload_bytes": 0,
+        "prompt_tokens": 0,
+        "wall_time": 0,
+    }
+    seen_images = set()
+    ocr_available = use_ocr and is_ocr_available()
+    uploaded_instructions = set()
+    context_cache = getattr(get_route(NARRATIVE).backend, "context_cache", None)
+
+    for file_path in file_paths:
+        try:
+            plan["pages"] += count_pages(file_path)
+            document, _ = extract_document(file_path)
+        except Exception as e:
+            print(f"Error planning {file_path}: {e}")
+            continue
+        if document is None:
+            continue
+        plan["files"] += 1
+
+        file_vision_calls = 0
+        described_images = 0
+        if include_images:
+            for image_bytes in iter_image_bytes(file_path):
+                described_images += 1
+                image_hash = hashlib.sha256(image_bytes).hexdigest()
+                cached_ocr = load_cached_stage("ocr", ocr_cache_key(image_hash)) if use_ocr else None
+                if image_hash in seen_images or (cached_ocr is not None and cached_ocr["text"]) \
+                        or load_cached_stage("image_description", image_description_cache_key(image_hash)) is not None:
+                    plan["cache_hits"] += 1
+                else:
+                    if ocr_available and cached_ocr is None:
+                        # Counted as a vision call, local OCR may still read it if it is mostly text
+                        plan["ocr_candidates"] += 1
+                    file_vision_calls += 1
+                    # The image is sent base64 encoded
+                    plan["upload_bytes"] += math.ceil(len(image_bytes) / 3) * 4
+                    plan["prompt_tokens"] += TOKENS_PER_IMAGE + len(IMAGE_DESCRIPTION_PROMPT) // CHARACTERS_PER_TOKEN
+                seen_images.add(image_hash)
+            plan["images"] += described_images
+            plan["vision_calls"] += file_vision_calls
+
+        text = render_document_text(document)
+        for language in target_languages:
+            system_instruction, content = create_summary_request(text, language)
+            content_tokens = len(content) // CHARACTERS_PER_TOKEN + described_images * TOKENS_PER_DESCRIPTION
+            instruction_tokens = len(system_instruction) // CHARACTERS_PER_TOKEN
+            plan["prompt_tokens"] += content_tokens + instruction_tokens
+            plan["upload_bytes"] += content_tokens * CHARACTERS_PER_TOKEN
+            cached = context_cache is not None and context_cache.accepts(system_instruction)
+            if not cached or language not in uploaded_instructions:
+                plan["upload_bytes"] += instruction_tokens * CHARACTERS_PER_TOKEN
+                uploaded_instructions.add(language)
+        plan["text_calls"] += len(target_languages)
+
+        # Files are processed one after the other: first the images, then the generation in every language
+        plan["wall_time"] += estimate_calls_time(IMAGE_DESCRIPTION, file_vision_calls)
+        plan["wall_time"] += estimate_calls_time(NARRATIVE, len(target_languages))
+
+    return plan
+
+def format_plan(plan):
+    """
+    Format a plan for display.
+
+    Parameters:
+    - plan (dict): The plan returned by plan_batch.
+
+    Returns:
+    - str: A multi-line report.
+    """
+    minutes, seconds = divmod(int(plan["wall_time"]), 60)
+    lines = [
+        f"Files: {plan['files']} ({plan['pages']} pages)",
+        f"Vision calls: {plan['vision_calls']} ({plan['images']} images, {plan['cache_hits']} cache hits)",
+    ]
+    if plan["ocr_candidates"]:
+        lines.append(f"  of which {plan['ocr_candidates']} may be read by local OCR instead")
+    lines += [
+        f"Text calls: {plan['text_calls']}",
+        f"Upload: {plan['upload_bytes'] / 1e6:.1f} MB",
+        f"Estimated prompt tokens: {plan['prompt_tokens']:,}",
+        f"Estimated time: {minutes} min {seconds} s",
+    ]
+    return "\n".join(lines)
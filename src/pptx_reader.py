@@ -0,0 +1,223 @@
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+
+NAMESPACES = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+NOTES_SLIDE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+
+
+def _tag(prefix, name):
+    return f"{{{NAMESPACES[prefix]}}}{name}"
+
+
+SP_TREE = _tag("p", "spTree")
+SHAPE = _tag("p", "sp")
+PICTURE = _tag("p", "pic")
+C_NV_PR = _tag("p", "cNvPr")
+PLACEHOLDER = _tag("p", "ph")
+PARAGRAPH = _tag("a", "p")
+TEXT = _tag("a", "t")
+LINE_BREAK = _tag("a", "br")
+BLIP = _tag("a", "blip")
+EMBED = _tag("r", "embed")
+MEDIA_FILES = {_tag("a", "videoFile"), _tag("a", "audioFile"), _tag("a", "quickTimeFile")}
+
+
+class PptxReader:
+    """
+    Reads the text, notes and pictures of a .pptx file straight from the slide XML parts of the zip archive.
+
+    The slide and notes parts are streamed with an incremental parser and only the shapes that python-pptx
+    exposes through slide.shapes are reported, so the text matches the python-pptx object model without
+    building it. Pictures are located through their relationship id and their media part is only read
+    on demand with read_part.
+
+    Attributes:
+    - file_path (str): The path to the .pptx file.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.zip_file = zipfile.ZipFile(file_path)
+        self.presentation_part = self._main_part()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying zip archive.
+        """
+        self.zip_file.close()
+
+    def _relationships(self, part_name):
+        """
+        Read the relationships of a part.
+
+        Parameters:
+        - part_name (str): The name of the part in the archive (e.g. "ppt/slides/slide1.xml").
+
+        Returns:
+        - dict: The relationships by id, each a (type, target part name) tuple.
+        """
+        rels_name = posixpath.join(posixpath.dirname(part_name), "_rels", posixpath.basename(part_name) + ".rels")
+        if rels_name not in self.zip_file.NameToInfo:
+            return {}
+        relationships = {}
+        root = ET.fromstring(self.zip_file.read(rels_name))
+        for relationship in root.iter(_tag("rel", "Relationship")):
+            target = relationship.get("Target")
+            if relationship.get("TargetMode") == "External":
+                continue
+            if target.startswith("/"):
+                target_part = target.lstrip("/")
+            else:
+                target_part = posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+            relationships[relationship.get("Id")] = (relationship.get("Type"), target_part)
+        return relationships
+
+    def _main_part(self):
+        for relationship_type, target in self._relationships("").values():
+            if relationship_type == OFFICE_DOCUMENT:
+                return target
+        return "ppt/presentation.xml"
+
+    def slide_parts(self):
+        """
+        Return the slide parts in presentation order.
+
+        Returns:
+        - list: The part names of the slides.
+        """
+        relationships = self._relationships(self.presentation_part)
+        slide_parts = []
+        with self.zip_file.open(self.presentation_part) as stream:
+            for _, element in ET.iterparse(stream):
+                if element.tag == _tag("p", "sldId"):
+                    slide_parts.append(relationships[element.get(_tag("r", "id"))][1])
+        return slide_parts
+
+    def slide_count(self):
+        """
+        Return the number of slides.
+
+        Returns:
+        - int: The number of slides.
+        """
+        return len(self.slide_parts())
+
+    def read_part(self, part_name):
+        """
+        Read a part of the archive, for example the media part of a picture.
+
+        Parameters:
+        - part_name (str): The name of the part.
+
+        Returns:
+        - bytes: The content of the part.
+        """
+        return self.zip_file.read(part_name)
+
+    def part_size(self, part_name):
+        """
+        Return the uncompressed size of a part without reading it.
+
+        Parameters:
+        - part_name (str): The name of the part.
+
+        Returns:
+        - int: The size of the part in bytes.
+        """
+        return self.zip_file.getinfo(part_name).file_size
+
+    def _shapes(self, part_name, relationships):
+        """
+        Stream the top-level shapes of a slide or notes slide.
+
+        Parameters:
+        - part_name (str): The name of the slide part.
+        - relationships (dict): The relationships of the part, used to locate the picture parts.
+
+        Returns:
+        - list: The shapes in document order, as dictionaries with a type ("text" for shapes with a text frame,
+          "picture" for pictures), a name, and the text or the picture's media part name.
+        """
+        shapes = []
+        stack = []
+        shape = None
+        with self.zip_file.open(part_name) as stream:
+            for event, element in ET.iterparse(stream, events=("start", "end")):
+                if event == "start":
+                    if stack and stack[-1] == SP_TREE and shape is None:
+                        # Only the direct children of the shape tree are exposed by slide.shapes
+                        if element.tag == SHAPE:
+                            shape = {"type": "text", "paragraphs": [], "element": element}
+                        elif element.tag == PICTURE:
+                            shape = {"type": "picture", "part": None, "media": False, "element": element}
+                        else:
+                            shape = {"type": "other", "element": element}
+                    elif shape is not None:
+                        if element.tag == C_NV_PR and "name" not in shape:
+                            shape["name"] = element.get("name", "")
+                        elif shape["type"] == "text" and element.tag == PARAGRAPH:
+                            shape["paragraphs"].append("")
+                        elif shape["type"] == "picture" and element.tag == PLACEHOLDER:
+                            shape["type"] = "other"
+                        elif shape["type"] == "picture" and (element.tag in MEDIA_FILES or element.tag.endswith("}media")):
+                            shape["media"] = True
+                    stack.append(element.tag)
+                    continue
+
+                stack.pop()
+                if shape is None:
+                    if element.tag != SP_TREE and SP_TREE not in stack:
+                        element.clear()
+                    continue
+                if shape["type"] == "text" and shape["paragraphs"]:
+                    if element.tag == TEXT:
+                        shape["paragraphs"][-1] += element.text or ""
+                    elif element.tag == LINE_BREAK:
+                        shape["paragraphs"][-1] += "\v"
+                elif shape["type"] == "picture" and element.tag == BLIP and shape["part"] is None:
+                    relationship = relationships.get(element.get(EMBED))
+                    shape["part"] = relationship[1] if relationship else None
+
+                if element is shape["element"]:
+                    if shape["type"] == "text":
+                        shapes.append({"type": "text", "name": shape.get("name", ""), "text": "\n".join(shape["paragraphs"])})
+                    elif shape["type"] == "picture" and not shape["media"] and shape["part"]:
+                        shapes.append({"type": "picture", "name": shape.get("name", ""), "part": shape["part"]})
+                    element.clear()
+                    shape = None
+        return shapes
+
+    def slides(self):
+        """
+        Iterate over the slides in presentation order.
+
+        Returns:
+        - generator: One dictionary per slide with its shapes (see _shapes) and the texts of the shapes
+          of its notes slide (None if the slide has no notes slide).
+        """
+        for slide_part in self.slide_parts():
+            relationships = self._relationships(slide_part)
+            notes = None
+            for relationship_type, target in relationships.values():
+                if relationship_type == NOTES_SLIDE:
+                    notes_shapes = self._shapes(target, {})
+                    notes = [shape["text"] for shape in notes_shapes if shape["type"] == "text"]
+            yield {
+                "shapes": self._shapes(slide_part, relationships),
+                "notes": notes,
+            }
@@ -0,0 +1,289 @@
+import argparse
+import base64
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from dotenv import load_dotenv
+
+from languages import OUTPUT_LANGUAGES
+from utils import OUTPUT_FORMATS, save_summary_sets, count_pages, summarize_file
+
+
+class JobService:
+    """
+    Queues summary jobs by priority and runs them on a shared pool of worker threads.
+
+    All the jobs share the process-wide routes of backends.py, so the concurrency and rate limits of each
+    route are enforced across jobs, and the HTTP connections and stage caches are reused between jobs.
+
+    Attributes:
+    - output_dir (str): The directory where the files and results of each job are stored.
+    - input_root (str): The only directory from which server-side paths are accepted, or None to accept uploads only.
+    - jobs (dict): The jobs by id, each a dictionary with its parameters, status and results.
+    """
+
+    def __init__(self, output_dir, workers=2, input_root=None):
+        self.output_dir = output_dir
+        self.input_root = os.path.realpath(input_root) if input_root else None
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def resolve_input_path(self, file_path):
+        """
+        Resolve a server-side path, refusing paths outside the input root.
+
+        Parameters:
+        - file_path (str): The path, absolute or relative to the input root.
+
+        Returns:
+        - str: The resolved path.
+        """
+        if self.input_root is None:
+            raise ValueError("File paths are not accepted by this service, upload the files instead")
+        resolved_path = os.path.realpath(os.path.join(self.input_root, file_path))
+        if os.path.commonpath([resolved_path, self.input_root]) != self.input_root:
+            raise ValueError(f"File outside the input root: {file_path}")
+        return resolved_path
+
+    def submit(self, request):
+        """
+        Validate a job request and queue it.
+
+        Parameters:
+        - request (dict): The job request with the keys files (list of paths inside the input root, or of dictionaries
+          with a name and a base64 content), languages (list), formats (list of "docx" and "pdf"), include_images (bool),
+          use_ocr (bool) and priority (int, lower values run first).
+
+        Returns:
+        - dict: The public view of the queued job.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object")
+        files = request.get("files")
+        if not files or not isinstance(files, list):
+            raise ValueError("files must be a non-empty list")
+        languages = request.get("languages", ["Italian"])
+        if not languages or not isinstance(languages, list) or any(language not in OUTPUT_LANGUAGES for language in languages):
+            raise ValueError(f"languages must be a non-empty list of {', '.join(OUTPUT_LANGUAGES)}")
+        formats = request.get("formats", ["docx"])
+        if not formats or not isinstance(formats, list) or any(output_format not in OUTPUT_FORMATS for output_format in formats):
+            raise ValueError(f"formats must be a non-empty list of {', '.join(OUTPUT_FORMATS)}")
+        include_images = request.get("include_images", False)
+        use_ocr = request.get("use_ocr", False)
+        if not isinstance(include_images, bool) or not isinstance(use_ocr, bool):
+            raise ValueError("include_images and use_ocr must be booleans")
+        priority = request.get("priority", 0)
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError("priority must be an integer")
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.output_dir, job_id)
+        os.makedirs(job_dir)
+
+        input_files = []
+        input_names = []
+        try:
+            for i, file in enumerate(files):
+                if isinstance(file, dict):
+                    # Uploaded file, stored in the job directory with its index so that uploads with the same name do not collide
+                    file_path = os.path.join(job_dir, f"{i:05d}_{os.path.basename(file['name'])}")
+                    with open(file_path, "wb") as input_file:
+                        input_file.write(base64.b64decode(file["content"]))
+                else:
+                    file_path = self.resolve_input_path(file)
+                if os.path.splitext(file_path)[1].lower() not in ('.pdf', '.pptx'):
+                    raise ValueError(f"Unsupported file: {os.path.basename(file_path)}")
+                if not os.path.exists(file_path):
+                    raise ValueError(f"File not found: {file_path}")
+                input_files.append(file_path)
+                input_names.append(os.path.basename(file["name"]) if isinstance(file, dict) else os.path.basename(file_path))
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "files": input_files,
+            "names": input_names,
+            "languages": languages,
+            "formats": formats,
+            "include_images": include_images,
+            "use_ocr": use_ocr,
+            "priority": priority,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "pages_done": 0,
+            "pages_total": None,
+            "results": [],
+            "errors": [],
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+        self.queue.put((job["priority"], next(self.sequence), job_id))
+        return self.view(job_id)
+
+    def view(self, job_id):
+        """
+        Return the public view of a job.
+
+        Parameters:
+        - job_id (str): The id of the job.
+
+        Returns:
+        - dict: A copy of the job, or None if there is no such job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def work(self):
+        """
+        Run queued jobs forever, highest priority first.
+        """
+        while True:
+            _, _, job_id = self.queue.get()
+            job = self.jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            try:
+                self.run(job)
+                job["status"] = "done"
+            except Exception as e:
+                job["errors"].append(f"Error running job: {str(e)}")
+                job["status"] = "failed"
+            job["finished_at"] = time.time()
+
+    def run(self, job):
+        """
+        Summarize the files of a job and save one output set per language in the job directory.
+
+        Parameters:
+        - job (dict): The job to run.
+        """
+        job["pages_total"] = 0
+        for file_path in job["files"]:
+            try:
+                job["pages_total"] += count_pages(file_path)
+            except Exception as e:
+                print(f"Error counting pages in {file_path}: {e}")
+
+        summaries = {language: [] for language in job["languages"]}
+        for i, (file_path, name) in enumerate(zip(job["files"], job["names"])):
+            title = f"{i + 1}. {os.path.splitext(name)[0]}"
+            try:
+                section_contents, job["pages_done"] = summarize_file(
+                    file_path, job["languages"], job["include_images"], job["use_ocr"], None, job["pages_done"])
+            except Exception as e:
+                error_msg = f"Error processing {name}: {str(e)}"
+                job["errors"].append(error_msg)
+                section_contents = {language: error_msg for language in job["languages"]}
+            for language in job["languages"]:
+                summaries[language].append({
+                    'title': title,
+                    'content': section_contents[language]
+                })
+
+        # The result names always carry the language, so that clients can find them without knowing how many there are
+        output_paths = save_summary_sets(os.path.join(self.output_dir, job["id"], "summary"), summaries, job["formats"],
+                                         always_suffix=True)
+        job["results"].extend(os.path.basename(output_path) for output_path in output_paths)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the job service.
+
+    - POST /jobs: queue a job (JSON body, see JobService.submit) and return it.
+    - GET /jobs: list the jobs.
+    - GET /jobs/<id>: return the status of a job.
+    - GET /jobs/<id>/results/<file>: download a result file of a finished job.
+    """
+
+    service = None
+    max_request_bytes = 100 * 1024 * 1024
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError("Invalid Content-Length")
+            if length > self.max_request_bytes:
+                self.send_json(413, {"error": f"Request larger than {self.max_request_bytes} bytes"})
+                return
+            request = json.loads(self.rfile.read(length))
+            self.send_json(202, self.service.submit(request))
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("/") if part]
+        if parts == ["jobs"]:
+            with self.service.lock:
+                job_ids = list(self.service.jobs)
+            self.send_json(200, [self.service.view(job_id) for job_id in job_ids])
+            return
+
+        job = self.service.view(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self.send_json(404, {"error": "Not found"})
+        elif len(parts) == 2:
+            self.send_json(200, job)
+        elif len(parts) == 4 and parts[2] == "results" and parts[3] in job["results"]:
+            with open(os.path.join(self.service.output_dir, job["id"], parts[3]), "rb") as result_file:
+                data = result_file.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the summary job service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of jobs run at the same time.")
+    parser.add_argument("--output-dir", default="jobs", help="Directory where job files and results are stored.")
+    parser.add_argument("--input-root", help="Directory from which jobs may reference files by path. Without it, only uploads are accepted.")
+    parser.add_argument("--max-request-mb", type=int, default=100, help="Maximum size of a job request, uploads included.")
+    args = parser.parse_args()
+
+    if args.host not in ("127.0.0.1", "localhost", "::1"):
+        print("Warning: the job service has no authentication, any host that can reach it can submit jobs and download results")
+    os.makedirs(args.output_dir, exist_ok=True)
+    JobRequestHandler.service = JobService(args.output_dir, args.workers, args.input_root)
+    JobRequestHandler.max_request_bytes = args.max_request_mb * 1024 * 1024
+    server = ThreadingHTTPServer((args.host, args.port), JobRequestHandler)
+    print(f"Job service listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"))
+    main()
@@ -0,0 +1,414 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from backends import CancelledError
+from languages import OUTPUT_LANGUAGES
+from utils import OUTPUT_FORMATS, save_summary_sets, summarize_file
+
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+class ShardQueue:
+    """
+    A batch of files shared by worker processes on one or more hosts through a directory on a shared filesystem.
+
+    Layout of the directory:
+    - batch.json: the files in output order and the options of the batch.
+    - inputs/: copies of the files, so that workers on other hosts can read them.
+    - leases/<index>.lease: the claim of a worker on a file, created atomically. A lease expires lease_seconds
+      after it was last refreshed, so the file of a crashed worker is claimed again by another worker.
+    - results/<index>.json: the summaries of a file in every language, written atomically.
+
+    Attributes:
+    - queue_dir (str): The shared directory.
+    - batch (dict): The content of batch.json.
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = queue_dir
+        with open(os.path.join(queue_dir, "batch.json"), "r", encoding="utf-8") as batch_file:
+            self.batch = json.load(batch_file)
+
+    @classmethod
+    def create(cls, queue_dir, files, languages, include_images=False, use_ocr=False, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Create the shared directory of a new batch.
+
+        Parameters:
+        - queue_dir (str): The shared directory, which must not already contain a batch.
+        - files (list): The paths to the PDF and PPTX files, in output order.
+        - languages (list): The output languages.
+        - include_images (bool): Whether to include image descriptions.
+        - use_ocr (bool): Whether to read mostly-text images with local OCR.
+        - lease_seconds (int): How long a claim lasts without being refreshed.
+
+        Returns:
+        - ShardQueue: The new queue.
+        """
+        if any(language not in OUTPUT_LANGUAGES for language in languages):
+            raise ValueError(f"languages must be a non-empty list of {', '.join(OUTPUT_LANGUAGES)}")
+        for file_path in files:
+            if os.path.splitext(file_path)[1].lower() not in ('.pdf', '.pptx'):
+                raise ValueError(f"Unsupported file: {os.path.basename(file_path)}")
+            if not os.path.exists(file_path):
+                raise ValueError(f"File not found: {file_path}")
+        if os.path.exists(os.path.join(queue_dir, "batch.json")):
+            raise ValueError(f"{queue_dir} already contains a batch")
+
+        for subdir in ("inputs", "leases", "results"):
+            os.makedirs(os.path.join(queue_dir, subdir), exist_ok=True)
+
+        batch_files = []
+        for i, file_path in enumerate(files):
+            input_name = f"{i:05d}_{os.path.basename(file_path)}"
+            shutil.copyfile(file_path, os.path.join(queue_dir, "inputs", input_name))
+            batch_files.append({"name": os.path.basename(file_path), "input": input_name})
+
+        batch = {
+            "files": batch_files,
+            "languages": languages,
+            "include_images": include_images,
+            "use_ocr": use_ocr,
+            "lease_seconds": lease_seconds,
+            "created_at": time.time(),
+        }
+        # batch.json is written last: workers only see complete batches
+        write_json_atomically(os.path.join(queue_dir, "batch.json"), batch)
+        return cls(queue_dir)
+
+    def input_path(self, index):
+        return os.path.join(self.queue_dir, "inputs", self.batch["files"][index]["input"])
+
+    def lease_path(self, index):
+        return os.path.join(self.queue_dir, "leases", f"{index:05d}.lease")
+
+    def result_path(self, index):
+        return os.path.join(self.queue_dir, "results", f"{index:05d}.json")
+
+    def pending(self):
+        """
+        Return the files that have no result yet.
+
+        Returns:
+        - list: The indexes of the files, in output order.
+        """
+        return [index for index in range(len(self.batch["files"])) if not os.path.exists(self.result_path(index))]
+
+    def _lease_expired(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime > self.batch["lease_seconds"]
+        except FileNotFoundError:
+            return True
+
+    def _lease_owner(self, index):
+        try:
+            with open(self.lease_path(index), "r", encoding="utf-8") as lease_file:
+                return json.load(lease_file)["worker"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _break_expired_lease(self, index, worker_id):
+        """
+        Remove the lease of a file if it has expired.
+
+        The lease is first renamed to a name of its own, which only one of the workers racing for it can do. If the
+        renamed lease turns out to have been refreshed in the meantime, it is put back.
+
+        Parameters:
+        - index (int): The index of the file.
+        - worker_id (str): The id of the worker breaking the lease.
+        """
+        lease_path = self.lease_path(index)
+        if not self._lease_expired(lease_path):
+            return
+        tombstone_path = f"{lease_path}.{worker_id}.expired"
+        try:
+            os.rename(lease_path, tombstone_path)
+        except FileNotFoundError:
+            return
+        try:
+            if not self._lease_expired(tombstone_path):
+                # Refreshed or re-created between the check and the rename: give it back to its owner
+                os.link(tombstone_path, lease_path)
+            else:
+                print(f"Lease on {self.batch['files'][index]['name']} expired, queued again")
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tombstone_path)
+
+    def claim(self, worker_id):
+        """
+        Claim the first pending file that is not leased by another worker.
+
+        Parameters:
+        - worker_id (str): The id of the claiming worker.
+
+        Returns:
+        - int: The index of the claimed file, or None if every pending file is leased.
+        """
+        for index in self.pending():
+            self._break_expired_lease(index, worker_id)
+            try:
+                # O_EXCL makes the creation fail if another worker holds the lease
+                lease_fd = os.open(self.lease_path(index), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(lease_fd, "w", encoding="utf-8") as lease_file:
+                json.dump({"worker": worker_id, "claimed_at": time.time()}, lease_file)
+            if os.path.exists(self.result_path(index)):
+                # Finished by another worker since pending() was read
+                self.release(index, worker_id)
+                continue
+            return index
+        return None
+
+    def renew(self, index, worker_id):
+        """
+        Refresh the lease of a worker on a file.
+
+        Parameters:
+        - index (int): The index of the file.
+        - worker_id (str): The id of the worker.
+
+        Returns:
+        - bool: False if the worker no longer holds the lease.
+        """
+        if self._lease_owner(index) != worker_id:
+            return False
+        try:
+            os.utime(self.lease_path(index))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, index, worker_id):
+        """
+        Remove the lease of a worker on a file, if it still holds it.
+
+        Parameters:
+        - index (int): The index of the file.
+        - worker_id (str): The id of the worker.
+        """
+        if self._lease_owner(index) == worker_id:
+            try:
+                os.remove(self.lease_path(index))
+            except FileNotFoundError:
+                pass
+
+    def save_result(self, index, result):
+        write_json_atomically(self.result_path(index), result)
+
+    def load_result(self, index):
+        with open(self.result_path(index), "r", encoding="utf-8") as result_file:
+            return json.load(result_file)
+
+
+def write_json_atomically(path, value):
+    """
+    Write a JSON file through a temporary file renamed over the target, so that readers never see a partial file.
+
+    Parameters:
+    - path (str): The path to the file.
+    - value: The JSON serializable value.
+    """
+    temp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as temp_file:
+        json.dump(value, temp_file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def keep_lease(shard_queue, index, worker_id, stop_event, cancel_event):
+    """
+    Refresh a lease until stop_event is set, and cancel the work on the file if the lease is lost.
+
+    Parameters:
+    - shard_queue (ShardQueue): The queue.
+    - index (int): The index of the file.
+    - worker_id (str): The id of the worker.
+    - stop_event (threading.Event): Event set when the work on the file is over.
+    - cancel_event (threading.Event): Event set if the lease is lost.
+    """
+    while not stop_event.wait(shard_queue.batch["lease_seconds"] / 3):
+        if not shard_queue.renew(index, worker_id):
+            print(f"Lost the lease on {shard_queue.batch['files'][index]['name']}, cancelling")
+            cancel_event.set()
+            return
+
+def run_worker(queue_dir, worker_id=None, poll_interval=2):
+    """
+    Claim and summarize the files of a batch until every file has a result.
+
+    While the remaining files are leased by other workers, the worker waits, so that it can take over the
+    files of workers that crash.
+
+    Parameters:
+    - queue_dir (str): The shared directory of the batch.
+    - worker_id (str): The id of the worker, by default the host name and process id.
+    - poll_interval (float): Seconds between two claim attempts while all the pending files are leased.
+    """
+    shard_queue = ShardQueue(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    languages = shard_queue.batch["languages"]
+
+    while True:
+        index = shard_queue.claim(worker_id)
+        if index is None:
+            if not shard_queue.pending():
+                return
+            time.sleep(poll_interval)
+            continue
+
+        name = shard_queue.batch["files"][index]["name"]
+        print(f"{worker_id}: processing {name}")
+        stop_event = threading.Event()
+        cancel_event = threading.Event()
+        threading.Thread(target=keep_lease, args=(shard_queue, index, worker_id, stop_event, cancel_event), daemon=True).start()
+        errors = []
+        try:
+            section_contents, _ = summarize_file(
+                shard_queue.input_path(index), languages, shard_queue.batch["include_images"],
+                shard_queue.batch["use_ocr"], cancel_event=cancel_event)
+        except CancelledError:
+            continue
+        except Exception as e:
+            error_msg = f"Error processing {name}: {str(e)}"
+            errors.append(error_msg)
+            section_contents = {language: error_msg for language in languages}
+        finally:
+            stop_event.set()
+
+        if not shard_queue.renew(index, worker_id) and os.path.exists(shard_queue.result_path(index)):
+            # The lease was lost and the worker that took the file over already saved its result
+            continue
+        shard_queue.save_result(index, {
+            "name": name,
+            "contents": section_contents,
+            "errors": errors,
+            "worker": worker_id,
+            "finished_at": time.time(),
+        })
+        shard_queue.release(index, worker_id)
+
+def assemble(queue_dir, output, formats, poll_interval=2):
+    """
+    Wait for the results of every file of a batch and save them in list order with the exporters.
+
+    Parameters:
+    - queue_dir (str): The shared directory of the batch.
+    - output (str): The output path, without extension. With several languages, the language is appended.
+    - formats (list): The output formats ("docx" and/or "pdf").
+    - poll_interval (float): Seconds between two checks of the results.
+
+    Returns:
+    - list: The paths of the saved files.
+    """
+    shard_queue = ShardQueue(queue_dir)
+    languages = shard_queue.batch["languages"]
+    total = len(shard_queue.batch["files"])
+
+    done = -1
+    while True:
+        pending = len(shard_queue.pending())
+        if total - pending != done:
+            done = total - pending
+            print(f"{done}/{total} files done")
+        if not pending:
+            break
+        time.sleep(poll_interval)
+
+    summaries = {language: [] for language in languages}
+    for index, batch_file in enumerate(shard_queue.batch["files"]):
+        result = shard_queue.load_result(index)
+        for error in result["errors"]:
+            print(error)
+        for language in languages:
+            summaries[language].append({
+                'title': f"{index + 1}. {os.path.splitext(batch_file['name'])[0]}",
+                'content': result["contents"][language]
+            })
+
+    return save_summary_sets(os.path.splitext(output)[0], summaries, formats)
+
+
+def submit_command(args):
+    ShardQueue.create(args.queue_dir, args.files, args.languages, args.images, args.ocr, args.lease_seconds)
+    print(f"Queued {len(args.files)} files in {args.queue_dir}")
+
+def worker_command(args):
+    run_worker(args.queue_dir, args.worker_id, args.poll_interval)
+
+def assemble_command(args):
+    for output_path in assemble(args.queue_dir, args.output, args.formats, args.poll_interval):
+        print(output_path)
+
+def run_local_command(args):
+    ShardQueue.create(args.queue_dir, args.files, args.languages, args.images, args.ocr, args.lease_seconds)
+    workers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", args.queue_dir,
+                          "--worker-id", f"{socket.gethostname()}-local{i + 1}", "--poll-interval", str(args.poll_interval)])
+        for i in range(args.workers)
+    ]
+    try:
+        assemble_command(args)
+    finally:
+        for worker in workers:
+            worker.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Share the files of a batch between workers through a shared directory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_batch_arguments(subparser):
+        subparser.add_argument("queue_dir", help="The shared directory of the batch.")
+        subparser.add_argument("files", nargs="+", help="The PDF and PPTX files, in output order.")
+        subparser.add_argument("--languages", nargs="+", default=["Italian"], choices=OUTPUT_LANGUAGES, help="Output languages.")
+        subparser.add_argument("--images", action="store_true", help="Include descriptions of the images.")
+        subparser.add_argument("--ocr", action="store_true", help="Read mostly-text images with local OCR.")
+        subparser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                               help="How long a claim lasts if its worker stops refreshing it.")
+
+    def add_output_arguments(subparser):
+        subparser.add_argument("--formats", nargs="+", default=["docx"], choices=OUTPUT_FORMATS, help="Output formats.")
+        subparser.add_argument("--output", default="summary", help="Output path, without extension.")
+
+    submit_parser = subparsers.add_parser("submit", help="Create the shared directory of a batch.")
+    add_batch_arguments(submit_parser)
+    submit_parser.set_defaults(func=submit_command)
+
+    worker_parser = subparsers.add_parser("worker", help="Process files of a batch until all are done.")
+    worker_parser.add_argument("queue_dir", help="The shared directory of the batch.")
+    worker_parser.add_argument("--worker-id", help="Id of the worker, by default the host name and process id.")
+    worker_parser.add_argument("--poll-interval", type=float, default=2, help="Seconds between two claim attempts.")
+    worker_parser.set_defaults(func=worker_command)
+
+    assemble_parser = subparsers.add_parser("assemble", help="Wait for the results of a batch and save them.")
+    assemble_parser.add_argument("queue_dir", help="The shared directory of the batch.")
+    add_output_arguments(assemble_parser)
+    assemble_parser.add_argument("--poll-interval", type=float, default=2, help="Seconds between two checks of the results.")
+    assemble_parser.set_defaults(func=assemble_command)
+
+    run_local_parser = subparsers.add_parser("run-local", help="Run a batch with several worker processes on this host.")
+    add_batch_arguments(run_local_parser)
+    add_output_arguments(run_local_parser)
+    run_local_parser.add_argument("--workers", type=int, default=2, help="Number of worker processes.")
+    run_local_parser.add_argument("--poll-interval", type=float, default=2, help="Seconds between two checks.")
+    run_local_parser.set_defaults(func=run_local_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"))
+    main()
@@ -1,10 +1,7 @@
-import requests
 import json
 import os
-import time
 
 from PyQt6.QtWidgets import QApplication
-from pptx import Presentation
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -15,127 +12,372 @@ from docx import Document
 import io
 from PIL import Image
 import base64
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from sympy.physics.units import current
 
+from backends import get_route, raise_if_cancelled, CancelledError, IMAGE_DESCRIPTION, NARRATIVE
+from pipeline import ImagePipeline
+from pptx_reader import PptxReader
 
-def send_request_to_api(prompt, max_retries=100):
+
+def send_request_to_api(prompt, max_retries=100, task=NARRATIVE, cancel_event=None, system_instruction=None):
     """
-    Send a request to the Gemini API with a given prompt, retrying if the request fails due to a 429 error.
+    Send a request with a given prompt to the model routed for the task, retrying if the request fails due to a 429 error.
 
     Parameters:
     - prompt (str): The specific prompt to include in the request.
     - max_retries (int): Maximum number of retries for the request.
+    - task (str): The task the request belongs to, used to pick the backend and model (see backends.get_route).
+    - cancel_event (threading.Event): Event set to cancel the request, or None.
+    - system_instruction (str): The static instructions sent apart from the prompt, or None.
 
     Returns:
     - str: The response text or an error message.
     """
-    url = os.getenv("GOOGLE_MODEL")
-    api_key = os.getenv("API_KEY")
+    parts = [
+        {"text": prompt}
+    ]
+    return get_route(task).generate(parts, max_retries, cancel_event, system_instruction)
 
-    model_config = {
-        "temperature": 0,
-    }
+def send_request_to_api_with_image(prompt, image_path=None, max_retries=1000, task=IMAGE_DESCRIPTION, image_bytes=None, cancel_event=None):
+    """
+    Send a request with a given prompt and image to the model routed for the task, retrying if the request fails due to a 429 error.
 
-    headers = {
-        "Content-Type": "application/json"
-    }
+    Parameters:
+    - prompt (str): The specific prompt to include in the request.
+    - image_path (str): Path to the image file to analyze (ignored if image_bytes is given).
+    - max_retries (int): Maximum number of retries for the request.
+    - task (str): The task the request belongs to, used to pick the backend and model (see backends.get_route).
+    - image_bytes (bytes): The PNG encoded image to analyze, used instead of reading image_path.
+    - cancel_event (threading.Event): Event set to cancel the request, or None.
 
-    data = {
-        "generation_config": model_config,
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt}
-                ]
+    Returns:
+    - str: The response text or an error message.
+    """
+    # Read and encode the image
+    if image_bytes is None:
+        with open(image_path, "rb") as img_file:
+            image_bytes = img_file.read()
+    image_data = base64.b64encode(image_bytes).decode("utf-8")
+    del image_bytes
+
+    parts = [
+        {"text": prompt},
+        {
+            "inline_data": {
+                "mime_type": "image/png",
+                "data": image_data
             }
-        ]
-    }
+        }
+    ]
+    return get_route(task).generate(parts, max_retries, cancel_event)
 
-    retries = 0
-    while retries <= max_retries:
-        try:
-            response = requests.post(f"{url}?key={api_key}", headers=headers, data=json.dumps(data))
-            if response.status_code == 200:
-                result = response.json()
-                try:
-                    return result['candidates'][0]['content']['parts'][0]['text'].replace("*", "")
-                except (KeyError, IndexError):
-                    raise Exception("Error: Unexpected response structure.")
-            elif response.status_code == 429:
-                retries += 1
-                time.sleep(1)
-            else:
-                raise Exception(f"Error {response.status_code}: {response.text}")
-        except Exception as e:
-            raise Exception(e)
-    raise Exception("Error: Maximum retries exceeded. Could not complete the request.")
+INTERMEDIATE_VERSION = 1
+
+IMAGE_DESCRIPTION_PROMPT = "Describe this image in 2-3 sentences. Focus on the main elements visible in the image."
+
+# PyMuPDF does not support being used from several threads at once: every fitz call holds this lock
+FITZ_LOCK = threading.Lock()
+
+def get_cache_dir():
+    """
+    Return the directory where intermediate stage outputs are cached.
+
+    Returns:
+    - str: The cache directory, taken from the CACHE_DIR environment variable (defaults to ".cache").
+    """
+    return os.getenv("CACHE_DIR", ".cache")
 
-def send_request_to_api_with_image(prompt, image_path, max_retries=1000):
+def load_cached_stage(stage, key):
     """
-    Send a request to the Gemini API with a given prompt and image, retrying if the request fails due to a 429 error.
+    Load a cached stage output.
 
     Parameters:
-    - prompt (str): The specific prompt to include in the request.
-    - image_path (str): Path to the image file to analyze.
-    - max_retries (int): Maximum number of retries for the request.
+    - stage (str): The name of the stage (for example "ocr" or "image_description").
+    - key (str): The content hash identifying the input of the stage.
 
     Returns:
-    - str: The response text or an error message.
+    - The cached value, or None if there is no cached value for the given key.
+    """
+    cache_path = os.path.join(get_cache_dir(), stage, f"{key}.json")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)["value"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_cached_stage(stage, key, value):
+    """
+    Save a stage output in the cache.
+
+    Parameters:
+    - stage (str): The name of the stage (for example "ocr" or "image_description").
+    - key (str): The content hash identifying the input of the stage.
+    - value: A JSON-serializable value to store.
+
+    The cache is only an optimization: a write that fails is reported and otherwise ignored.
+    """
+    stage_dir = os.path.join(get_cache_dir(), stage)
+    cache_path = os.path.join(stage_dir, f"{key}.json")
+    temp_path = None
+    try:
+        os.makedirs(stage_dir, exist_ok=True)
+        # A temporary file of its own per writer, as several threads may write the same key (e.g. a repeated image)
+        temp_fd, temp_path = tempfile.mkstemp(dir=stage_dir, prefix=f"{key}.", suffix=".tmp")
+        with os.fdopen(temp_fd, "w", encoding="utf-8") as cache_file:
+            json.dump({"value": value}, cache_file)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Error writing the {stage} cache: {str(e)}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def get_ocr_text_coverage():
     """
-    # For Gemini Pro Vision, which supports image inputs
-    url = os.getenv("GOOGLE_MODEL")
-    api_key = os.getenv("API_KEY")
+    Return the minimum fraction of an image covered by text for the image to be read with local OCR.
 
+    Returns:
+    - float: The OCR_TEXT_COVERAGE environment variable, or 0.15.
+    """
+    return float(os.getenv("OCR_TEXT_COVERAGE", "0.15"))
 
-    model_config = {
-        "temperature": 0,
-    }
+def image_stage_cache_key(image_hash, *settings):
+    """
+    Return the cache key of an image stage, combining the image hash with the settings that affect the stage output.
 
-    headers = {
-        "Content-Type": "application/json"
-    }
+    Parameters:
+    - image_hash (str): The SHA-256 hash of the image bytes.
+    - settings: The values the stage output depends on.
 
-    # Read and encode the image
-    with open(image_path, "rb") as img_file:
-        image_data = base64.b64encode(img_file.read()).decode("utf-8")
-
-    # Structure the request for Gemini Pro Vision
-    data = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt},
-                    {
-                        "inline_data": {
-                            "mime_type": "image/png",
-                            "data": image_data
-                        }
-                    }
-                ]
-            }
-        ],
-        "generation_config": model_config
-    }
+    Returns:
+    - str: The SHA-256 hash of the image hash and the settings.
+    """
+    return hashlib.sha256(json.dumps([image_hash, *settings]).encode("utf-8")).hexdigest()
 
-    retries = 0
-    while retries <= max_retries:
-        try:
-            response = requests.post(f"{url}?key={api_key}", headers=headers, data=json.dumps(data))
-            if response.status_code == 200:
-                result = response.json()
+def ocr_cache_key(image_hash):
+    """
+    Return the cache key of the OCR result of an image, which depends on the text coverage threshold.
+
+    Parameters:
+    - image_hash (str): The SHA-256 hash of the image bytes.
+
+    Returns:
+    - str: The cache key.
+    """
+    return image_stage_cache_key(image_hash, "ocr-v2", get_ocr_text_coverage())
+
+def image_description_cache_key(image_hash):
+    """
+    Return the cache key of the description of an image, which depends on the backend, the model and the prompt
+    of the image description route.
+
+    Parameters:
+    - image_hash (str): The SHA-256 hash of the image bytes.
+
+    Returns:
+    - str: The cache key.
+    """
+    backend = get_route(IMAGE_DESCRIPTION).backend
+    return image_stage_cache_key(image_hash, getattr(backend, "name", type(backend).__name__),
+                                 getattr(backend, "model_url", None), IMAGE_DESCRIPTION_PROMPT)
+
+class OcrUnavailableError(Exception):
+    """
+    Local OCR could not run: pytesseract or the Tesseract engine is missing, or Tesseract failed.
+    """
+
+
+def is_ocr_available():
+    """
+    Check whether local OCR can run.
+
+    Returns:
+    - bool: True if pytesseract is installed and finds the Tesseract engine.
+    """
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return False
+    return True
+
+def extract_text_with_ocr(pil_image, min_text_coverage=None, min_confidence=60):
+    """
+    Run a local OCR pass on an image and return its text if the image is mostly text.
+
+    The image is classified as mostly text when the bounding boxes of the recognised words cover at least
+    min_text_coverage of the image area. Requires the optional pytesseract package and the Tesseract engine.
+
+    Parameters:
+    - pil_image (PIL.Image.Image): The image to analyse.
+    - min_text_coverage (float): Minimum fraction of the image area covered by words (defaults to the
+      OCR_TEXT_COVERAGE environment variable, or 0.15).
+    - min_confidence (int): Minimum Tesseract confidence for a word to be counted.
+
+    Returns:
+    - str: The extracted text, or None if the image is not mostly text.
+
+    Raises:
+    - OcrUnavailableError: If pytesseract is not installed or Tesseract fails, so that the image is not classified.
+    """
+    try:
+        import pytesseract
+    except ImportError:
+        raise OcrUnavailableError("pytesseract is not installed")
+
+    if min_text_coverage is None:
+        min_text_coverage = get_ocr_text_coverage()
+
+    if pil_image.mode not in ('RGB', 'L'):
+        pil_image = pil_image.convert('RGB')
+
+    try:
+        data = pytesseract.image_to_data(pil_image, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        raise OcrUnavailableError(f"Error running local OCR: {str(e)}")
+
+    word_area = 0
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip() or float(data["conf"][i]) < min_confidence:
+            continue
+        word_area += data["width"][i] * data["height"][i]
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line_key, []).append(word)
+
+    image_area = pil_image.width * pil_image.height
+    if not lines or image_area == 0 or word_area / image_area < min_text_coverage:
+        return None
+
+    return "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+
+def describe_image(image_bytes, use_ocr=False, cancel_event=None):
+    """
+    Describe an image, reading its text locally when it is mostly text and using the vision API otherwise.
+
+    Both the OCR result and the API description are cached by image content and by the settings they depend on
+    (see ocr_cache_key and image_description_cache_key), so an image seen before does not trigger a new OCR pass
+    or API call, and is not even decoded.
+
+    Parameters:
+    - image_bytes (bytes): The encoded image, as stored in the document.
+    - use_ocr (bool): Whether to run the local OCR pre-pass.
+    - cancel_event (threading.Event): Event set to cancel the request, or None.
+
+    Returns:
+    - str: The SHA-256 hash of the image bytes.
+    - str: The description of the image.
+    """
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    description_key = image_description_cache_key(image_hash)
+
+    cached_ocr = load_cached_stage("ocr", ocr_cache_key(image_hash)) if use_ocr else None
+    if cached_ocr is None or not cached_ocr["text"]:
+        image_description = load_cached_stage("image_description", description_key)
+        if image_description is not None:
+            return image_hash, image_description
+
+    pil_image = Image.open(io.BytesIO(image_bytes))
+
+    # Handle CMYK images
+    if pil_image.mode == 'CMYK':
+        pil_image = pil_image.convert('RGB')
+
+    if use_ocr:
+        if cached_ocr is None:
+            try:
+                cached_ocr = {"text": extract_text_with_ocr(pil_image)}
+                save_cached_stage("ocr", ocr_cache_key(image_hash), cached_ocr)
+            except OcrUnavailableError as e:
+                # Nothing is cached, so the image is classified once OCR works
+                print(f"{str(e)}, describing the image with the vision API")
+        if cached_ocr is not None and cached_ocr["text"]:
+            return image_hash, f"The image contains the following text: {cached_ocr['text']}"
+
+    # Encode the image as PNG in memory, keeping only the encoded bytes (not the decoded image or the buffer)
+    # while the request is in flight
+    png_buffer = io.BytesIO()
+    pil_image.save(png_buffer, format="PNG")
+    pil_image.close()
+    del pil_image
+    png_bytes = png_buffer.getvalue()
+    del png_buffer
+    image_description = send_request_to_api_with_image(
+        prompt=IMAGE_DESCRIPTION_PROMPT,
+        image_bytes=png_bytes,
+        cancel_event=cancel_event
+    )
+    del png_bytes
+    save_cached_stage("image_description", description_key, image_description)
+    return image_hash, image_description
+
+def update_progress(progress, value):
+    """
+    Update the progress bar, if any, and let the UI process its events.
+
+    Parameters:
+    - progress (QProgressDialog): The progress bar to update, or None when running without a UI.
+    - value (int): The new progress value.
+    """
+    if progress is None:
+        return
+    progress.setValue(value)
+    QApplication.processEvents()
+
+def create_image_pipeline(use_ocr=False, progress=None, cancel_event=None):
+    """
+    Create the pipeline describing the images of a document with a bounded amount of image data in memory.
+
+    The byte budget is read from the IMAGE_BUFFER_BYTES environment variable (default 64 MB) and the number
+    of workers matches the concurrency of the image description route.
+
+    Parameters:
+    - use_ocr (bool): Whether to run the local OCR pre-pass.
+    - progress (QProgressDialog): The progress bar of the UI, or None when running without a UI.
+    - cancel_event (threading.Event): Event set to cancel the pending descriptions, or None.
+
+    Returns:
+    - ImagePipeline: The pipeline, to be used as a context manager.
+    """
+    return ImagePipeline(
+        lambda image_bytes: describe_image(image_bytes, use_ocr, cancel_event),
+        max_inflight_bytes=int(os.getenv("IMAGE_BUFFER_BYTES", str(64 * 1024 * 1024))),
+        workers=get_route(IMAGE_DESCRIPTION).concurrency,
+        on_wait=QApplication.processEvents if progress is not None else None,
+        cancel_event=cancel_event
+    )
+
+def resolve_image_descriptions(pipeline, pages):
+    """
+    Replace the images still being described in the page records with their descriptions.
+
+    Images whose description failed are left out of the records.
+
+    Parameters:
+    - pipeline (ImagePipeline): The pipeline the images were submitted to.
+    - pages (list): The page records, whose image blocks are (future, error message) tuples.
+    """
+    for page in pages:
+        blocks = []
+        for block in page["blocks"]:
+            if isinstance(block, tuple):
+                future, error_message = block
                 try:
-                    return result['candidates'][0]['content']['parts'][0]['text'].replace("*", "")
-                except (KeyError, IndexError):
-                    raise Exception("Error: Unexpected response structure.")
-            elif response.status_code == 429:
-                retries += 1
-                time.sleep(1)
-            else:
-                raise Exception(f"Error {response.status_code}: {response.text}")
-        except Exception as e:
-            raise Exception(str(e))
-    raise Exception("Error: Maximum retries exceeded. Could not complete the request.")
+                    image_hash, description = pipeline.result(future)
+                    block = ["image", image_hash, description]
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"{error_message}: {str(e)}")
+                    continue
+            blocks.append(block)
+        page["blocks"] = blocks
 
 def save_as_docx_file(output_path, summaries):
     """
@@ -159,6 +401,34 @@ def save_as_docx_file(output_path, summaries):
             doc.add_page_break()
     doc.save(output_path)
 
+OUTPUT_FORMATS = ["docx", "pdf"]
+
+def save_summary_sets(base_path, summaries, formats, always_suffix=False):
+    """
+    Save the summaries of every output language in the given formats.
+
+    With several output languages, each output set gets the language as suffix (e.g. summary_English.docx).
+
+    Parameters:
+    - base_path (str): The output path, without extension.
+    - summaries (dict): The summaries by language, each a list of dictionaries containing a title and a content string.
+    - formats (list): The output formats ("docx" and/or "pdf").
+    - always_suffix (bool): Whether to append the language even with a single output language.
+
+    Returns:
+    - list: The paths of the saved files.
+    """
+    output_paths = []
+    for language, language_summaries in summaries.items():
+        language_base_path = f"{base_path}_{language}" if always_suffix or len(summaries) > 1 else base_path
+        if "docx" in formats:
+            save_as_docx_file(f"{language_base_path}.docx", language_summaries)
+            output_paths.append(f"{language_base_path}.docx")
+        if "pdf" in formats:
+            save_as_pdf_file(f"{language_base_path}.pdf", language_summaries)
+            output_paths.append(f"{language_base_path}.pdf")
+    return output_paths
+
 def save_as_pdf_file(output_path, summaries):
 
     """
@@ -221,110 +491,259 @@ def save_as_pdf_file(output_path, summaries):
     doc.build(story)
 
 
-def extract_text_from_pptx(file_path, progress, current_page_progress):
+def extract_pages_from_pptx(file_path, progress, current_page_progress, include_images=False, use_ocr=False, cancel_event=None):
     """
-    Extract text from a PowerPoint (.pptx) file, including slide content and notes.
+    Extract the page records of a PowerPoint (.pptx) file: the text of its shapes, its notes and, optionally, image descriptions.
 
     Parameters:
-    - file_path (str): The path to the .pptx file from which text will be extracted.
-    - progress (QProgressBar): A progress bar to update when extracting text.
+    - file_path (str): The path to the .pptx file.
+    - progress (QProgressBar): A progress bar to update when extracting, or None.
     - current_page_progress (int): The current page number.
+    - include_images (bool): Whether to describe the pictures of the slides.
+    - use_ocr (bool): Whether to read mostly-text images with local OCR instead of the vision API.
 
     Returns:
-    - str: A string containing the extracted text from the slides and their notes,
-           with slide content separated by newlines and notes prefixed with "Note:".
+    - list: One record per slide, with the slide number and its blocks in order: ["text", text], ["image", hash, description] and ["note", text].
     - int: The updated current page number.
     """
-    text = ""
-    presentation = Presentation(file_path)
-    for slide in presentation.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                text += shape.text + "\n"
-        # Extract slide notes
-        if slide.has_notes_slide:
-            notes_slide = slide.notes_slide
-            for shape in notes_slide.shapes:
-                if hasattr(shape, "text") and shape.text.strip():
-                    text += f"\nNote: {shape.text}"
-        current_page_progress += 1
-        progress.setValue(current_page_progress)
-        QApplication.processEvents()
-    return text, current_page_progress
-
-def extract_text_and_images_from_pptx(file_path, progress, current_page_progress):
+    pages = []
+
+    with PptxReader(file_path) as reader, create_image_pipeline(use_ocr, progress, cancel_event) as pipeline:
+        for i, slide in enumerate(reader.slides()):
+            raise_if_cancelled(cancel_event)
+            blocks = []
+
+            for shape in slide["shapes"]:
+                # Extract text from shapes
+                if shape["type"] == "text":
+                    blocks.append(["text", shape["text"]])
+
+                # Process images
+                if shape["type"] == "picture" and include_images:
+                    try:
+                        # Queue the image, the description is generated while the next slides are walked
+                        future = pipeline.submit(reader.read_part(shape["part"]))
+                        blocks.append((future, f"Error generating image {shape['name']} at slide {i + 1} in {os.path.basename(file_path)} with description"))
+
+                    except CancelledError:
+                        raise
+                    except Exception as e:
+                        print(f"Error generating image at slide {i + 1} in {os.path.basename(file_path)} with description: {str(e)}")
+
+            # Extract slide notes
+            if slide["notes"] is not None:
+                for note in slide["notes"]:
+                    blocks.append(["note", note])
+
+            pages.append({"page": i + 1, "blocks": blocks})
+            current_page_progress += 1
+            update_progress(progress, current_page_progress)
+
+        resolve_image_descriptions(pipeline, pages)
+
+    return pages, current_page_progress
+
+def extract_pages_from_pdf(file_path, progress, current_page_progress, include_images=False, use_ocr=False, cancel_event=None):
     """
-    Extract text and images from a PowerPoint (.pptx) file, including slide content, notes, and AI-generated descriptions of images.
+    Extract the page records of a PDF file: the text of its pages, its annotations and, optionally, image descriptions.
 
     Parameters:
-    - file_path (str): The path to the .pptx file from which text and images will be extracted.
-    - progress (QProgressBar): A progress bar to update when extracting text and images.
+    - file_path (str): The path to the PDF file.
+    - progress (QProgressBar): A progress bar to update when extracting, or None.
     - current_page_progress (int): The current page number.
+    - include_images (bool): Whether to describe the images of the pages.
+    - use_ocr (bool): Whether to read mostly-text images with local OCR instead of the vision API.
 
     Returns:
-    - str: A string containing the extracted text from the slides and their notes, with slide content separated by newlines and notes prefixed with Note:, and AI-generated image descriptions prefixed with Image Description:.
+    - list: One record per page, with the page number and its blocks in order: ["text", text], ["image", hash, description] and ["note", text].
     - int: The updated current page number.
     """
-    text = ""
-    presentation = Presentation(file_path)
+    pages = []
 
-    for i, slide in enumerate(presentation.slides):
-        text += f"\n\n--- Slide {i + 1} ---\n"
+    with FITZ_LOCK:
+        pdf_document = fitz.open(file_path)
+        page_count = pdf_document.page_count
 
-        # Extract text from shapes
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text.strip():
-                text += shape.text.strip() + "\n"
+    # FITZ_LOCK is only held during the fitz calls, never while waiting for the image pipeline
+    try:
+        with create_image_pipeline(use_ocr, progress, cancel_event) as pipeline:
+            for page_num in range(page_count):
+                raise_if_cancelled(cancel_event)
 
-            # Process images
-            if shape.shape_type == 13:  # MSO_SHAPE_TYPE.PICTURE
-                try:
-                    # Extract image
-                    image = shape.image
-                    image_bytes = image.blob
+                with FITZ_LOCK:
+                    page = pdf_document[page_num]
 
-                    # Save image to memory buffer
-                    image_buffer = io.BytesIO(image_bytes)
-                    pil_image = Image.open(image_buffer)
+                    # Extract text from page
+                    blocks = [["text", page.get_text()]]
 
-                    if pil_image.mode == 'CMYK':
-                        pil_image = pil_image.convert('RGB')
+                    # Extract images
+                    image_list = page.get_images(full=True) if include_images else []
 
-                    # Generate a temporary file path to save the image
-                    temp_image_path = f"temp_image_slide_{i + 1}_{shape.name}.png"
-                    pil_image.save(temp_image_path)
+                    # Extract annotations
+                    notes = [["note", annot.info.get("content", "")] for annot in page.annots()]
 
-                    # Generate description using AI
+                for img_index, img_info in enumerate(image_list):
                     try:
-                        # Modified send_request_to_api that handles images
-                        image_description = send_request_to_api_with_image(
-                            prompt="Describe this image in 2-3 sentences. Focus on the main elements visible in the image.",
-                            image_path=temp_image_path,  # Or use base64_image if API accepts base64
-                        )
-                        text += f"\n[Image Description: {image_description}]\n"
-
+                        # Get the image and queue it, blocking while too many image bytes are in flight
+                        xref = img_info[0]
+                        with FITZ_LOCK:
+                            image_bytes = pdf_document.extract_image(xref)["image"]
+                        future = pipeline.submit(image_bytes)
+                        del image_bytes
+                        blocks.append((future, f"Error generating image on page {page_num + 1} in {os.path.basename(file_path)} with description"))
+
+                    except CancelledError:
+                        raise
                     except Exception as e:
-                        print(f"Error generating image {temp_image_path} in {os.path.basename(file_path)} with description: {str(e)}")
+                        print(f"Error processing image on page {page_num + 1} in {os.path.basename(file_path)}: {str(e)}")
 
-                    # Cleanup temporary file
-                    if os.path.exists(temp_image_path):
-                        os.remove(temp_image_path)
+                blocks.extend(notes)
+                pages.append({"page": page_num + 1, "blocks": blocks})
+                current_page_progress += 1
+                update_progress(progress, current_page_progress)
 
-                except Exception as e:
-                    print(f"Error generating image at slide {i + 1} in {os.path.basename(file_path)} with description: {str(e)}")
+            resolve_image_descriptions(pipeline, pages)
+    finally:
+        with FITZ_LOCK:
+            pdf_document.close()
+
+    return pages, current_page_progress
+
+def extract_document(file_path, include_images=False, use_ocr=False, progress=None, current_page_progress=0, cancel_event=None):
+    """
+    Extract a document into its intermediate form, which holds everything needed to generate its summary.
 
-        # Extract slide notes
-        if slide.has_notes_slide:
-            notes_slide = slide.notes_slide
-            for shape in notes_slide.shapes:
-                if hasattr(shape, "text") and shape.text.strip():
-                    text += f"\nNote: {shape.text}"
+    Parameters:
+    - file_path (str): The path to the PDF or PPTX file.
+    - include_images (bool): Whether to include descriptions of the images.
+    - use_ocr (bool): Whether to read mostly-text images with local OCR instead of the vision API.
+    - progress (QProgressBar): A progress bar to update, or None when running without a UI.
+    - current_page_progress (int): The current page number.
+    - cancel_event (threading.Event): Event set to cancel the extraction, or None.
 
-        current_page_progress += 1
-        progress.setValue(current_page_progress)
-        QApplication.processEvents()
+    Returns:
+    - dict: The document with its source name, format, content hash (SHA-256 of the file), extraction options and page records,
+      or None for unsupported files.
+    - int: The updated current page number.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.pdf':
+        pages, current_page_progress = extract_pages_from_pdf(file_path, progress, current_page_progress, include_images, use_ocr, cancel_event)
+    elif file_extension == '.pptx':
+        pages, current_page_progress = extract_pages_from_pptx(file_path, progress, current_page_progress, include_images, use_ocr, cancel_event)
+    else:
+        return None, current_page_progress
+
+    content_hash = hashlib.sha256()
+    with open(file_path, "rb") as source_file:
+        for chunk in iter(lambda: source_file.read(1024 * 1024), b""):
+            content_hash.update(chunk)
+
+    document = {
+        "version": INTERMEDIATE_VERSION,
+        "source": os.path.basename(file_path),
+        "format": file_extension[1:],
+        "content_hash": content_hash.hexdigest(),
+        "include_images": include_images,
+        "use_ocr": use_ocr,
+        "pages": pages,
+    }
+    return document, current_page_progress
 
-    return text, current_page_progress
+def render_document_text(document):
+    """
+    Render the text of an extracted document, as included in the summary prompt.
+
+    Without images, the text of each page (or the text of each slide shape) is followed by its notes prefixed with Note:.
+    With images, each page starts with a --- Page n --- (or --- Slide n ---) header and image descriptions are prefixed
+    with Image Description:.
+
+    Parameters:
+    - document (dict): The document returned by extract_document or load_document.
+
+    Returns:
+    - str: The text of the document.
+    """
+    text = ""
+    is_pdf = document["format"] == "pdf"
+    for page in document["pages"]:
+        if document["include_images"]:
+            text += f"\n\n--- {'Page' if is_pdf else 'Slide'} {page['page']} ---\n"
+        for block in page["blocks"]:
+            if block[0] == "text":
+                if not document["include_images"]:
+                    text += block[1] if is_pdf else block[1] + "\n"
+                elif block[1].strip():
+                    text += block[1].strip() + "\n"
+            elif block[0] == "image":
+                text += f"\n[Image Description: {block[2]}]\n"
+            elif block[0] == "note":
+                if is_pdf and not document["include_images"]:
+                    text += f"\nNote: {block[1]}"
+                elif block[1].strip():
+                    text += f"\nNote: {block[1]}\n" if is_pdf else f"\nNote: {block[1]}"
+    return text
+
+def save_document(output_path, document):
+    """
+    Save an extracted document as a compact JSON intermediate file.
+
+    Parameters:
+    - output_path (str): The path of the intermediate file.
+    - document (dict): The document returned by extract_document.
+    """
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump(document, output_file, ensure_ascii=False, separators=(",", ":"))
+
+def load_document(input_path):
+    """
+    Load an extracted document from an intermediate file.
+
+    Parameters:
+    - input_path (str): The path of the intermediate file.
+
+    Returns:
+    - dict: The document.
+    """
+    with open(input_path, "r", encoding="utf-8") as input_file:
+        document = json.load(input_file)
+    if document.get("version") != INTERMEDIATE_VERSION:
+        raise Exception(f"Error: Unsupported intermediate file version in {os.path.basename(input_path)}.")
+    return document
+
+def extract_text_from_pptx(file_path, progress, current_page_progress):
+    """
+    Extract text from a PowerPoint (.pptx) file, including slide content and notes.
+
+    Parameters:
+    - file_path (str): The path to the .pptx file from which text will be extracted.
+    - progress (QProgressBar): A progress bar to update when extracting text, or None.
+    - current_page_progress (int): The current page number.
+
+    Returns:
+    - str: A string containing the extracted text from the slides and their notes,
+           with slide content separated by newlines and notes prefixed with "Note:".
+    - int: The updated current page number.
+    """
+    pages, current_page_progress = extract_pages_from_pptx(file_path, progress, current_page_progress)
+    return render_document_text({"format": "pptx", "include_images": False, "pages": pages}), current_page_progress
+
+def extract_text_and_images_from_pptx(file_path, progress, current_page_progress, use_ocr=False):
+    """
+    Extract text and images from a PowerPoint (.pptx) file, including slide content, notes, and AI-generated descriptions of images.
+
+    Parameters:
+    - file_path (str): The path to the .pptx file from which text and images will be extracted.
+    - progress (QProgressBar): A progress bar to update when extracting text and images, or None.
+    - current_page_progress (int): The current page number.
+    - use_ocr (bool): Whether to read mostly-text images with local OCR instead of the vision API.
+
+    Returns:
+    - str: A string containing the extracted text from the slides and their notes, with slide content separated by newlines and notes prefixed with Note:, and AI-generated image descriptions prefixed with Image Description:.
+    - int: The updated current page number.
+    """
+    pages, current_page_progress = extract_pages_from_pptx(file_path, progress, current_page_progress, True, use_ocr)
+    return render_document_text({"format": "pptx", "include_images": True, "pages": pages}), current_page_progress
 
 def extract_text_from_pdf(file_path, progress, current_page_progress):
     """
@@ -332,7 +751,7 @@ def extract_text_from_pdf(file_path, progress, current_page_progress):
 
     Parameters:
     - file_path (str): The path to the PDF file from which text will be extracted.
-    - progress (QProgressBar): A progress bar to update when extracting text.
+    - progress (QProgressBar): A progress bar to update when extracting text, or None.
     - current_page_progress (int): The current page number.
 
     Returns:
@@ -340,127 +759,139 @@ def extract_text_from_pdf(file_path, progress, current_page_progress):
            with annotations prefixed with "Note:".
     - int: The updated current page number.
     """
-    text = ""
-    pdf_document = fitz.open(file_path)
-    for page in pdf_document:
-        text += page.get_text()
-        # Extract annotations
-        for annot in page.annots():
-            text += f"\nNote: {annot.info['content']}"
-        current_page_progress += 1
-        progress.setValue(current_page_progress)
-        QApplication.processEvents()
-    pdf_document.close()
-    return text, current_page_progress
-
-def extract_text_and_images_from_pdf(file_path, progress, current_page_progress):
+    pages, current_page_progress = extract_pages_from_pdf(file_path, progress, current_page_progress)
+    return render_document_text({"format": "pdf", "include_images": False, "pages": pages}), current_page_progress
+
+def extract_text_and_images_from_pdf(file_path, progress, current_page_progress, use_ocr=False):
     """
     Extract text and images from a PDF file, including page content, annotations, and images.
 
     Parameters:
     - file_path (str): The path to the PDF file from which text and images will be extracted.
-    - progress (QProgressBar): A progress bar to update when extracting text and images.
+    - progress (QProgressBar): A progress bar to update when extracting text and images, or None.
     - current_page_progress (int): The current page number.
+    - use_ocr (bool): Whether to read mostly-text images with local OCR instead of the vision API.
 
     Returns:
     - str: A string containing the extracted text from the PDF file, with annotations prefixed with Note: and AI-generated image descriptions prefixed with Image Description:.
     - int: The updated current page number.
     """
-    text = ""
-    pdf_document = fitz.open(file_path)
+    pages, current_page_progress = extract_pages_from_pdf(file_path, progress, current_page_progress, True, use_ocr)
+    return render_document_text({"format": "pdf", "include_images": True, "pages": pages}), current_page_progress
 
-    for page_num, page in enumerate(pdf_document):
-        text += f"\n\n--- Page {page_num + 1} ---\n"
 
-        # Extract text from page
-        page_text = page.get_text()
-        if page_text.strip():
-            text += page_text.strip() + "\n"
-
-        # Extract images
-        image_list = page.get_images(full=True)
-
-        for img_index, img_info in enumerate(image_list):
-            try:
-                # Get the image
-                xref = img_info[0]
-                base_image = pdf_document.extract_image(xref)
-                image_bytes = base_image["image"]
+def create_summary_request(text, target_language):
+    """
+    Create the request for a fully expanded and cohesive textual version of the given content in the specified target language.
+    The output must preserve all information while transforming it into a natural, readable narrative.
 
-                # Create a PIL image
-                image_buffer = io.BytesIO(image_bytes)
-                pil_image = Image.open(image_buffer)
+    The instructions only depend on the target language, so they are sent as a system instruction that can be
+    cached and reused across the files of a batch, and the content carries only the text.
 
-                # Handle CMYK images
-                if pil_image.mode == 'CMYK':
-                    pil_image = pil_image.convert('RGB')
+    Parameters:
+    - text (str): The full content, including main text, notes, and image descriptions.
+    - target_language (str): The language in which the expanded text should be provided.
 
-                # Save image to temporary file
-                temp_image_path = f"temp_image_page_{page_num + 1}_{img_index}.png"
-                pil_image.save(temp_image_path)
+    Returns:
+    - str: The system instruction for generating the expanded text.
+    - str: The content, with the text to expand.
+    """
+    system_instruction = f"""Please rewrite the content provided by the user in {target_language} as a fully expanded, cohesive, and detailed narrative.
 
-                # Generate description using AI
-                try:
-                    # Using the new function that can handle images
-                    image_description = send_request_to_api_with_image(
-                        prompt="Describe this image in 2-3 sentences. Focus on the main elements visible in the image.",
-                        image_path=temp_image_path
-                    )
-                    text += f"\n[Image Description: {image_description}]\n"
-                except Exception as e:
-                    print(f"Error generating image on page {page_num + 1} in {os.path.basename(file_path)} with description: {str(e)}")
+CRITICAL INSTRUCTION: You MUST include EVERYTHING from:
+1. The main text
+2. All notes (marked with "Note:")
+3. All image descriptions (marked with "Image Description:")
+4. All formulas (mathematical or otherwise), exactly as provided.
 
-                # Cleanup temporary file
-                if os.path.exists(temp_image_path):
-                    os.remove(temp_image_path)
+**DO NOT include any structural references like "Page 1" or "Image 1". These references should not appear in the final text.**
 
-            except Exception as e:
-                print(f"Error processing image on page {page_num + 1} in {os.path.basename(file_path)}: {str(e)}")
+Your output MUST fully retain **every single detail** provided. Do NOT summarize or omit any information, no matter how minor it seems. The final narrative should include **all information** from the text, notes, image descriptions, and formulas exactly as provided, **with no details left out**.
 
-        # Extract annotations
-        for annot in page.annots():
-            if "content" in annot.info and annot.info["content"].strip():
-                text += f"\nNote: {annot.info['content']}\n"
+When describing visual elements such as graphs, charts, or diagrams, ensure that **every detail** of the description is fully explained, and their significance or meaning is clearly conveyed. **Do not abbreviate or condense** the descriptions of images—fully explain what they represent and their relevance to the overall content.
 
-        current_page_progress += 1
-        progress.setValue(current_page_progress)
-        QApplication.processEvents()
+When formulas are included, you must **transcribe them exactly as they appear**, and explain their significance and how they fit into the broader context of the content. **Do not leave any formulas out** or reduce their complexity.
 
-    pdf_document.close()
-    return text, current_page_progress
+Your narrative should flow seamlessly, as if all the information was originally part of a cohesive document. The content should be integrated smoothly into one continuous narrative without separating the different components.
 
+The result should be detailed, thorough, and well-structured, resembling an informative article or lecture that seamlessly incorporates every detail from all sources without leaving anything out or overly condensing any part. Avoid bullet points and ensure the final text is rich in information and clarity."""
+    content = f"""Text to expand:
+{text}"""
+    return system_instruction, content
 
-def create_summary_prompt(text, target_language):
+def generate_summaries(text, target_languages, progress=None, cancel_event=None):
     """
-    Create a fully expanded and cohesive textual version of the given content in the specified target language.
-    The output must preserve all information while transforming it into a natural, readable narrative.
+    Generate the expanded text of a document in several languages, issuing one request per language concurrently.
 
     Parameters:
-    - text (str): The full content, including main text, notes, and image descriptions.
-    - target_language (str): The language in which the expanded text should be provided.
+    - text (str): The extracted content of the document.
+    - target_languages (list): The languages in which the expanded text should be provided.
+    - progress (QProgressBar): The progress bar of the UI, kept responsive while waiting, or None.
+    - cancel_event (threading.Event): Event set to cancel the requests, or None.
 
     Returns:
-    - str: A formatted prompt string for generating the expanded text.
-    """
-    return f"""Please rewrite the following content in {target_language} as a fully expanded, cohesive, and detailed narrative.
-
-                CRITICAL INSTRUCTION: You MUST include EVERYTHING from:
-                1. The main text
-                2. All notes (marked with "Note:")
-                3. All image descriptions (marked with "Image Description:")
-                4. All formulas (mathematical or otherwise), exactly as provided.
+    - dict: A dictionary mapping each target language to the generated text, or to an error message if the request failed.
 
-                **DO NOT include any structural references like "Page 1" or "Image 1". These references should not appear in the final text.**
-
-                Your output MUST fully retain **every single detail** provided. Do NOT summarize or omit any information, no matter how minor it seems. The final narrative should include **all information** from the text, notes, image descriptions, and formulas exactly as provided, **with no details left out**.
+    Raises:
+    - CancelledError: If cancel_event is set before all the texts are generated.
+    """
+    def generate(target_language):
+        try:
+            system_instruction, content = create_summary_request(text, target_language)
+            return send_request_to_api(content, cancel_event=cancel_event, system_instruction=system_instruction)
+        except CancelledError:
+            raise
+        except Exception as e:
+            return f"Error generating summary in {target_language}: {str(e)}"
+
+    with ThreadPoolExecutor(max_workers=max(1, len(target_languages))) as executor:
+        futures = [executor.submit(generate, target_language) for target_language in target_languages]
+        while not all(future.done() for future in futures):
+            raise_if_cancelled(cancel_event)
+            wait(futures, timeout=0.1)
+            if progress is not None:
+                QApplication.processEvents()
+        contents = [future.result() for future in futures]
+    return dict(zip(target_languages, contents))
+
+def count_pages(file_path):
+    """
+    Count the pages (PDF) or slides (PPTX) of a document.
 
-                When describing visual elements such as graphs, charts, or diagrams, ensure that **every detail** of the description is fully explained, and their significance or meaning is clearly conveyed. **Do not abbreviate or condense** the descriptions of images—fully explain what they represent and their relevance to the overall content.
+    Parameters:
+    - file_path (str): The path to the document.
 
-                When formulas are included, you must **transcribe them exactly as they appear**, and explain their significance and how they fit into the broader context of the content. **Do not leave any formulas out** or reduce their complexity.
+    Returns:
+    - int: The number of pages or slides, 0 for unsupported files.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.pdf':
+        with FITZ_LOCK, fitz.open(file_path) as pdf_document:
+            return pdf_document.page_count
+    elif file_extension == '.pptx':
+        with PptxReader(file_path) as reader:
+            return reader.slide_count()
+    return 0
+
+def summarize_file(file_path, target_languages, include_images=False, use_ocr=False, progress=None, current_page_progress=0, cancel_event=None):
+    """
+    Extract the content of a document once and generate its expanded text in every target language.
 
-                Your narrative should flow seamlessly, as if all the information was originally part of a cohesive document. The content should be integrated smoothly into one continuous narrative without separating the different components.
+    Parameters:
+    - file_path (str): The path to the PDF or PPTX file.
+    - target_languages (list): The languages in which the expanded text should be provided.
+    - include_images (bool): Whether to include descriptions of the images.
+    - use_ocr (bool): Whether to read mostly-text images with local OCR instead of the vision API.
+    - progress (QProgressBar): A progress bar to update, or None when running without a UI.
+    - current_page_progress (int): The current page number.
+    - cancel_event (threading.Event): Event set to cancel the extraction and the requests, or None.
 
-                Text to expand:
-                {text}
+    Returns:
+    - dict: A dictionary mapping each target language to the generated text, or None for unsupported files.
+    - int: The updated current page number.
+    """
+    document, current_page_progress = extract_document(file_path, include_images, use_ocr, progress, current_page_progress, cancel_event)
+    if document is None:
+        return None, current_page_progress
 
-                The result should be detailed, thorough, and well-structured, resembling an informative article or lecture that seamlessly incorporates every detail from all sources without leaving anything out or overly condensing any part. Avoid bullet points and ensure the final text is rich in information and clarity."""
\ No newline at end of file
+    return generate_summaries(render_document_text(document), target_languages, progress, cancel_event), current_page_progress
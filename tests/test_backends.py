@@ -0,0 +1,369 @@
+"""
+Tests of the retry, circuit breaker, hedging, cancellation and context caching behaviour of the backends and routes,
+run against the stub backend and scripted responses without any network call.
+"""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import backends
+from backends import (CancelledError, CircuitBreaker, CircuitOpenError, ContextCache, GeminiBackend, Route,
+                      StubBackend, TransientRequestError)
+
+
+class ScriptedBackend(StubBackend):
+    """
+    Stub backend whose calls take the given latencies (0.01s once the list is used up) or raise the given
+    exceptions, and which records the calls in flight and the calls that saw their cancellation.
+    """
+
+    def __init__(self, outcomes=()):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.cancelled = 0
+
+    def generate(self, parts, max_retries=100, cancel_event=None, system_instruction=None):
+        with self.lock:
+            outcome = self.outcomes.pop(0) if self.outcomes else 0.01
+            self.calls.append(parts)
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            try:
+                backends.wait_or_cancel(outcome, cancel_event)
+            except CancelledError:
+                with self.lock:
+                    self.cancelled += 1
+                raise
+            return f"response {len(self.calls)}"
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+class ScriptedSession:
+    """
+    Replaces the requests session of a GeminiBackend, answering each post with the next scripted response.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+        self.posts = []
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        self.urls.append(url)
+        self.posts.append(json.loads(data))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def ok_response(text="hello"):
+    return Response(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+def make_gemini_backend(responses, monkeypatch):
+    monkeypatch.setattr(backends, "wait_or_cancel", lambda seconds, cancel_event: backends.raise_if_cancelled(cancel_event))
+    backend = GeminiBackend("https://example.com/v1beta/models/test-model:generateContent", "key")
+    backend.session = ScriptedSession(responses)
+    return backend
+
+
+def warm_up(route, calls=Route.min_hedge_samples):
+    for _ in range(calls):
+        route.generate([{"text": "warm up"}])
+
+
+# Stub backend
+
+def test_stub_backend_is_deterministic():
+    backend = StubBackend("stub-model")
+    assert backend.generate([{"text": "abc"}]) == "Stub response from stub-model to a prompt of 3 characters."
+    assert backend.calls == [[{"text": "abc"}]]
+
+
+def test_stub_backend_times_out(monkeypatch):
+    monkeypatch.setenv("STUB_LATENCY", "0.2")
+    backend = StubBackend(timeout=0.05)
+    with pytest.raises(TransientRequestError):
+        backend.generate([{"text": "abc"}])
+
+
+# Retries
+
+def test_gemini_retries_transient_errors(monkeypatch):
+    backend = make_gemini_backend([Response(503, {}), requests.exceptions.ConnectionError("reset"), ok_response()], monkeypatch)
+    assert backend.generate([{"text": "abc"}]) == "hello"
+    assert len(backend.session.posts) == 3
+
+
+def test_gemini_gives_up_after_transient_retries(monkeypatch):
+    monkeypatch.setenv("TRANSIENT_RETRIES", "2")
+    backend = make_gemini_backend([Response(500, {})] * 3, monkeypatch)
+    with pytest.raises(TransientRequestError):
+        backend.generate([{"text": "abc"}])
+    assert len(backend.session.posts) == 3
+
+
+def test_gemini_retries_rate_limited_requests(monkeypatch):
+    backend = make_gemini_backend([Response(429, {}), Response(429, {}), ok_response()], monkeypatch)
+    assert backend.generate([{"text": "abc"}]) == "hello"
+
+
+def test_gemini_does_not_retry_permanent_errors(monkeypatch):
+    backend = make_gemini_backend([Response(400, {"error": "bad request"}), ok_response()], monkeypatch)
+    with pytest.raises(Exception) as error:
+        backend.generate([{"text": "abc"}])
+    assert not isinstance(error.value, TransientRequestError)
+    assert len(backend.session.posts) == 1
+
+
+def test_gemini_sends_the_system_instruction(monkeypatch):
+    backend = make_gemini_backend([ok_response()], monkeypatch)
+    backend.generate([{"text": "abc"}], system_instruction="Be thorough.")
+    assert backend.session.posts[0]["system_instruction"] == {"parts": [{"text": "Be thorough."}]}
+
+
+# Circuit breaker
+
+def test_breaker_opens_after_consecutive_failures():
+    backend = ScriptedBackend([TransientRequestError("down")] * 2)
+    route = Route("test", backend, 1, 0, circuit_breaker=CircuitBreaker(2, 60))
+    for _ in range(2):
+        with pytest.raises(TransientRequestError):
+            route.generate([{"text": "abc"}])
+    with pytest.raises(CircuitOpenError):
+        route.generate([{"text": "abc"}])
+    assert len(backend.calls) == 2
+
+
+def test_breaker_sends_a_single_trial_call_after_the_reset_timeout():
+    backend = ScriptedBackend([TransientRequestError("down"), TransientRequestError("still down")])
+    route = Route("test", backend, 1, 0, circuit_breaker=CircuitBreaker(1, 0.1))
+    with pytest.raises(TransientRequestError):
+        route.generate([{"text": "abc"}])
+    time.sleep(0.15)
+    # The failed trial call opens the circuit again
+    with pytest.raises(TransientRequestError):
+        route.generate([{"text": "abc"}])
+    with pytest.raises(CircuitOpenError):
+        route.generate([{"text": "abc"}])
+    time.sleep(0.15)
+    # A successful trial call closes it
+    assert route.generate([{"text": "abc"}])
+    assert route.generate([{"text": "abc"}])
+    assert len(backend.calls) == 4
+
+
+def test_permanent_errors_do_not_open_the_breaker():
+    backend = ScriptedBackend([ValueError("bad request")] * 3)
+    route = Route("test", backend, 1, 0, circuit_breaker=CircuitBreaker(2, 60))
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            route.generate([{"text": "abc"}])
+    assert route.generate([{"text": "abc"}])
+
+
+# Concurrency and hedging
+
+def test_route_respects_its_concurrency():
+    backend = ScriptedBackend([0.1] * 8)
+    route = Route("test", backend, 2, 0)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: route.generate([{"text": "abc"}]), range(8)))
+    assert backend.peak_inflight == 2
+
+
+def test_hedged_duplicate_answers_a_slow_call_and_the_loser_is_cancelled():
+    backend = ScriptedBackend([0.01] * Route.min_hedge_samples + [5, 0.01])
+    route = Route("test", backend, 2, 0, hedge_percentile=50)
+    warm_up(route)
+    start = time.monotonic()
+    assert route.generate([{"text": "abc"}])
+    assert time.monotonic() - start < 1
+    time.sleep(0.2)
+    assert backend.cancelled == 1
+    # Both slots are free again
+    assert route.semaphore.acquire(blocking=False) and route.semaphore.acquire(blocking=False)
+
+
+def test_hedging_never_exceeds_the_concurrency():
+    backend = ScriptedBackend([0.01] * Route.min_hedge_samples + [0.5] * 4)
+    route = Route("test", backend, 2, 0, hedge_percentile=50)
+    warm_up(route)
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: route.generate([{"text": "abc"}]), range(4)))
+    assert backend.peak_inflight == 2
+    # The slots were full, so no duplicate was sent
+    assert len(backend.calls) == Route.min_hedge_samples + 4
+
+
+def test_hedging_does_not_wait_for_the_rate_limit():
+    backend = ScriptedBackend([0.01] * Route.min_hedge_samples + [0.3])
+    route = Route("test", backend, 2, 0, hedge_percentile=50)
+    warm_up(route)
+    # 6 calls per minute: the primary call takes the only rate slot of the next 10 seconds
+    route.rate_limiter = backends.RateLimiter(6)
+    start = time.monotonic()
+    assert route.generate([{"text": "abc"}])
+    assert time.monotonic() - start < 1
+    # The hedge was skipped
+    assert len(backend.calls) == Route.min_hedge_samples + 1
+
+
+# Cancellation
+
+def test_cancel_stops_a_call_in_flight():
+    backend = ScriptedBackend([5])
+    breaker = CircuitBreaker(1, 60)
+    route = Route("test", backend, 1, 0, circuit_breaker=breaker)
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+    start = time.monotonic()
+    with pytest.raises(CancelledError):
+        route.generate([{"text": "abc"}], cancel_event=cancel_event)
+    assert time.monotonic() - start < 1
+    # A cancelled call is not a failure of the endpoint, and its slot is released when it ends
+    assert breaker.opened_at is None
+    time.sleep(0.2)
+    assert route.generate([{"text": "abc"}])
+
+
+def test_abandoned_call_does_not_delay_the_exit():
+    # The backend ignores the cancellation, as an HTTP call waiting for its response does
+    script = textwrap.dedent("""
+        import threading, time
+        from backends import CancelledError, Route, StubBackend
+
+        class HungBackend(StubBackend):
+            def generate(self, parts, max_retries=100, cancel_event=None, system_instruction=None):
+                time.sleep(30)
+
+        cancel_event = threading.Event()
+        threading.Timer(0.1, cancel_event.set).start()
+        try:
+            Route("test", HungBackend(), 1, 0).generate([{"text": "abc"}], cancel_event=cancel_event)
+        except CancelledError:
+            print("cancelled")
+    """)
+    start = time.monotonic()
+    result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(backends.__file__), capture_output=True,
+                            text=True, timeout=20)
+    assert result.stdout.strip() == "cancelled"
+    assert time.monotonic() - start < 10
+
+
+def test_cancel_stops_waiting_for_a_slot():
+    backend = ScriptedBackend([1])
+    route = Route("test", backend, 1, 0)
+    with ThreadPoolExecutor(1) as executor:
+        busy = executor.submit(route.generate, [{"text": "busy"}])
+        time.sleep(0.05)
+        cancel_event = threading.Event()
+        threading.Timer(0.1, cancel_event.set).start()
+        start = time.monotonic()
+        with pytest.raises(CancelledError):
+            route.generate([{"text": "abc"}], cancel_event=cancel_event)
+        assert time.monotonic() - start < 0.5
+        assert busy.result()
+    assert len(backend.calls) == 1
+
+
+def test_cancel_stops_the_retry_backoff(monkeypatch):
+    monkeypatch.setattr(backends.random, "uniform", lambda a, b: b)
+    backend = GeminiBackend("https://example.com/v1beta/models/test-model:generateContent", "key")
+    backend.session = ScriptedSession([Response(503, {})] * 5)
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+    start = time.monotonic()
+    with pytest.raises(CancelledError):
+        backend.generate([{"text": "abc"}], cancel_event=cancel_event)
+    assert time.monotonic() - start < 0.5
+    assert len(backend.session.posts) == 1
+
+
+# Context caching
+
+INSTRUCTION = "Summarize the slides. " * 10
+
+
+def test_instruction_is_uploaded_once_then_referenced_by_name():
+    backend = StubBackend()
+    backend.context_cache = ContextCache(3600, min_tokens=10)
+    for _ in range(3):
+        backend.generate([{"text": "abc"}], system_instruction=INSTRUCTION)
+    assert list(backend.cached_contents.values()) == [INSTRUCTION]
+    assert backend.uploaded_characters == len(INSTRUCTION) + 3 * len("abc")
+
+
+def test_small_instruction_is_sent_inline():
+    backend = StubBackend()
+    backend.context_cache = ContextCache(3600, min_tokens=len(INSTRUCTION))
+    for _ in range(3):
+        backend.generate([{"text": "abc"}], system_instruction=INSTRUCTION)
+    assert backend.cached_contents == {}
+    assert backend.uploaded_characters == 3 * (len(INSTRUCTION) + len("abc"))
+
+
+def test_gemini_references_the_cached_content(monkeypatch):
+    backend = make_gemini_backend([Response(200, {"name": "cachedContents/abc"}), ok_response(), ok_response()], monkeypatch)
+    backend.context_cache = ContextCache(3600, min_tokens=10)
+    for _ in range(2):
+        assert backend.generate([{"text": "abc"}], system_instruction=INSTRUCTION) == "hello"
+    assert backend.session.urls[0].startswith("https://example.com/v1beta/cachedContents?")
+    assert backend.session.posts[0]["model"] == "models/test-model"
+    assert backend.session.posts[0]["system_instruction"] == {"parts": [{"text": INSTRUCTION}]}
+    for post in backend.session.posts[1:]:
+        assert post["cachedContent"] == "cachedContents/abc"
+        assert "system_instruction" not in post
+
+
+def test_failed_creation_falls_back_to_inline(monkeypatch):
+    backend = make_gemini_backend([Response(400, {"error": "too small"}), ok_response(), ok_response()], monkeypatch)
+    backend.context_cache = ContextCache(3600, min_tokens=10)
+    for _ in range(2):
+        assert backend.generate([{"text": "abc"}], system_instruction=INSTRUCTION) == "hello"
+    # The failure is remembered, so the creation is not tried again
+    assert len(backend.session.posts) == 3
+    for post in backend.session.posts[1:]:
+        assert post["system_instruction"] == {"parts": [{"text": INSTRUCTION}]}
+        assert "cachedContent" not in post
+
+
+@pytest.mark.parametrize("status_code", [400, 404])
+def test_refused_cached_content_is_disabled_and_sent_inline(monkeypatch, status_code):
+    backend = make_gemini_backend([Response(200, {"name": "cachedContents/abc"}), Response(status_code, {"error": "expired"}),
+                                   ok_response(), ok_response()], monkeypatch)
+    backend.context_cache = ContextCache(3600, min_tokens=10)
+    assert backend.generate([{"text": "abc"}], system_instruction=INSTRUCTION) == "hello"
+    assert backend.session.posts[1]["cachedContent"] == "cachedContents/abc"
+    assert backend.session.posts[2]["system_instruction"] == {"parts": [{"text": INSTRUCTION}]}
+    assert "cachedContent" not in backend.session.posts[2]
+    # The next request does not reference the refused cached content again
+    assert backend.generate([{"text": "abc"}], system_instruction=INSTRUCTION) == "hello"
+    assert "cachedContent" not in backend.session.posts[3]
+    assert len(backend.session.posts) == 4
@@ -0,0 +1,61 @@
+"""
+Tests of the validation of job requests by the summary service.
+"""
+import base64
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from service import JobRequestHandler, JobService
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # No workers, so the queued jobs are never run
+    monkeypatch.setattr(JobRequestHandler, "service", JobService(str(tmp_path / "jobs"), workers=0))
+    (tmp_path / "jobs").mkdir()
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), JobRequestHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def post_job(server, body):
+    request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}/jobs", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def upload(name="deck.pptx"):
+    return {"name": name, "content": base64.b64encode(b"not really a deck").decode("ascii")}
+
+
+@pytest.mark.parametrize("body", [[upload()], "files", 3, None])
+def test_non_object_body_is_rejected(server, body):
+    status, response = post_job(server, body)
+    assert status == 400
+    assert "JSON object" in response["error"]
+
+
+@pytest.mark.parametrize("field, value", [("priority", "high"), ("priority", 1.5), ("priority", True),
+                                          ("include_images", "yes"), ("use_ocr", 1), ("languages", "English")])
+def test_invalid_field_leaves_no_job_directory(server, tmp_path, field, value):
+    status, _ = post_job(server, {"files": [upload()], field: value})
+    assert status == 400
+    assert list((tmp_path / "jobs").iterdir()) == []
+
+
+def test_valid_job_is_queued(server, tmp_path):
+    status, job = post_job(server, {"files": [upload()], "languages": ["English"], "priority": -1, "use_ocr": True})
+    assert status == 202
+    assert job["status"] == "queued"
+    assert [path.name for path in (tmp_path / "jobs").iterdir()] == [job["id"]]
@@ -0,0 +1,85 @@
+"""
+Tests of the lease protocol of the shared batch directory, run against the stub backend.
+"""
+import os
+import threading
+import time
+
+import docx
+import fitz  # PyMuPDF
+import pytest
+
+import backends
+import shard
+from shard import ShardQueue
+
+LEASE_SECONDS = 1
+
+
+@pytest.fixture(autouse=True)
+def stub_routes(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path / "cache"))
+    backends.reset_routes()
+    yield
+    backends.reset_routes()
+
+
+def create_pdf(file_path, text):
+    with fitz.open() as pdf_document:
+        page = pdf_document.new_page()
+        page.insert_text((72, 72), text)
+        pdf_document.save(file_path)
+    return str(file_path)
+
+
+@pytest.fixture
+def shard_queue(tmp_path):
+    # Names whose alphabetical order differs from the list order
+    files = [create_pdf(tmp_path / f"{name}.pdf", f"Slides of {name}") for name in ("charlie", "alpha", "bravo")]
+    return ShardQueue.create(str(tmp_path / "queue"), files, ["English"], lease_seconds=LEASE_SECONDS)
+
+
+def backdate_lease(shard_queue, index):
+    expired = time.time() - 2 * LEASE_SECONDS
+    os.utime(shard_queue.lease_path(index), (expired, expired))
+
+
+def test_workers_claim_different_files(shard_queue):
+    assert shard_queue.claim("worker-a") == 0
+    assert shard_queue.claim("worker-b") == 1
+    assert shard_queue.claim("worker-a") == 2
+    # Every pending file is leased
+    assert shard_queue.claim("worker-c") is None
+
+
+def test_stale_lease_is_taken_over(shard_queue):
+    assert shard_queue.claim("worker-a") == 0
+    backdate_lease(shard_queue, 0)
+    assert shard_queue.claim("worker-b") == 0
+    # The first worker has lost the lease and cannot refresh or release it
+    assert not shard_queue.renew(0, "worker-a")
+    shard_queue.release(0, "worker-a")
+    assert shard_queue.renew(0, "worker-b")
+
+
+def test_worker_finishes_the_file_of_a_crashed_worker(shard_queue):
+    assert shard_queue.claim("crashed") == 0
+    backdate_lease(shard_queue, 0)
+    shard.run_worker(shard_queue.queue_dir, "worker-a", poll_interval=0.05)
+    assert shard_queue.pending() == []
+    assert shard_queue.load_result(0)["worker"] == "worker-a"
+    assert os.listdir(os.path.join(shard_queue.queue_dir, "leases")) == []
+
+
+def test_assemble_keeps_the_list_order(shard_queue, tmp_path):
+    workers = [threading.Thread(target=shard.run_worker, args=(shard_queue.queue_dir, f"worker-{i}", 0.05)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    output_paths = shard.assemble(shard_queue.queue_dir, str(tmp_path / "summary"), ["docx"], poll_interval=0.05)
+    for worker in workers:
+        worker.join()
+
+    assert output_paths == [str(tmp_path / "summary.docx")]
+    headings = [paragraph.text for paragraph in docx.Document(output_paths[0]).paragraphs if paragraph.style.name == "Heading 1"]
+    assert headings == ["1. charlie", "2. alpha", "3. bravo"]
@@ -0,0 +1,94 @@
+"""
+Tests of the stage cache and the image description pipeline, run against the stub backend.
+"""
+import io
+import sys
+import threading
+
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image
+
+import backends
+import planner
+import utils
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+def test_concurrent_writes_of_the_same_key(cache_dir):
+    errors = []
+
+    def write(i):
+        try:
+            for _ in range(100):
+                utils.save_cached_stage("stage", "key", {"writer": i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert utils.load_cached_stage("stage", "key")["writer"] in range(8)
+    assert [path.name for path in (cache_dir / "stage").iterdir()] == ["key.json"]
+
+
+def test_failed_cache_write_is_ignored(cache_dir):
+    # The cache directory cannot be created where a file already exists
+    cache_dir.write_text("not a directory")
+    utils.save_cached_stage("stage", "key", {"value": 1})
+    assert utils.load_cached_stage("stage", "key") is None
+
+
+@pytest.fixture
+def stub_routes(monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "stub")
+    monkeypatch.setenv("STUB_LATENCY", "0.05")
+    monkeypatch.setenv("IMAGE_DESCRIPTION_CONCURRENCY", "8")
+    backends.reset_routes()
+    yield
+    backends.reset_routes()
+
+
+def create_pdf_with_repeated_image(file_path, pages):
+    image = io.BytesIO()
+    Image.effect_noise((64, 64), 60).convert("RGB").save(image, format="PNG")
+    with fitz.open() as pdf_document:
+        for _ in range(pages):
+            page = pdf_document.new_page()
+            page.insert_text((72, 72), "Page with a logo")
+            page.insert_image(fitz.Rect(72, 100, 136, 164), stream=image.getvalue())
+        pdf_document.save(file_path)
+
+
+def test_repeated_image_is_described_once(tmp_path, stub_routes):
+    file_path = str(tmp_path / "logo.pdf")
+    create_pdf_with_repeated_image(file_path, 40)
+
+    plan = planner.plan_batch([file_path], ["English"], include_images=True)
+    document, _ = utils.extract_document(file_path, include_images=True)
+
+    image_blocks = [block for page in document["pages"] for block in page["blocks"] if block[0] == "image"]
+    assert len(image_blocks) == 40
+    assert len(backends.get_route(backends.IMAGE_DESCRIPTION).backend.calls) == plan["vision_calls"] == 1
+
+
+def test_missing_ocr_is_not_cached(cache_dir, stub_routes, monkeypatch):
+    # pytesseract cannot be imported
+    monkeypatch.setitem(sys.modules, "pytesseract", None)
+    image = io.BytesIO()
+    Image.effect_noise((64, 64), 60).convert("RGB").save(image, format="PNG")
+
+    _, description = utils.describe_image(image.getvalue(), use_ocr=True)
+
+    assert description.startswith("Stub description")
+    assert not (cache_dir / "ocr").exists()
+    assert not utils.is_ocr_available()